@@ -1,34 +1,83 @@
+import argparse
+import signal
 import sys
-import traceback
+import threading
 import warnings
 from time import sleep
 
+from src.core.log import logger
+from src.core.log import setup_logging
+from src.core.metrics import start_metrics_server
 from src.core.rabbitmq import RabbitMQ
+from src.core.rabbitmq.aio import AsyncioRabbitMQ
+from src.core.rabbitmq.threaded import ThreadedRabbitMQ
 from src.core.settings import *  # noqa
+from src.core.supervisor import Supervisor
+from src.core.tracing import setup_tracing
 from src.gateways import sms
 from src.gateways import webpush
 
 warnings.filterwarnings("ignore")
 
-while True:
+ENGINES = {"blocking": RabbitMQ, "threads": ThreadedRabbitMQ, "asyncio": AsyncioRabbitMQ}
 
-    try:
-        mb = RabbitMQ()
-        ############# execute gateways ############
-        sms.execute()
-        webpush.execute()
 
-        ############# start consuming ############
-        mb.start()
+def consume(args):
+    if METRICS_ENABLED:
+        start_metrics_server()
 
-    except Exception as err:  # noqa
-        print(err)  # todo: move this to log table.
-        traceback.print_exc()  # todo: move this to log table.
-        mb.reset_channel()
+    stopping = threading.Event()
 
-    except KeyboardInterrupt:
-        # todo: save interrupt to log table.
-        sys.exit(1)
+    def stop(signum, frame):
+        if stopping.is_set():
+            # a supervisor forwards SIGTERM after the CTRL+C its workers got as well, only a second CTRL+C forces the exit.
+            if signum == signal.SIGINT:
+                logger.warning("[*] Stopped without finishing the deliveries in flight.")
+                sys.exit(1)
+            return
+        logger.info("[*] Stopping, finishing the deliveries in flight. Press CTRL+C again to exit right away.")
+        stopping.set()
+        if hasattr(RabbitMQ, "instance"):
+            RabbitMQ.instance.stop()
 
-    finally:
-        sleep(1)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+
+        try:
+            mb = ENGINES[args.engine](concurrency=args.concurrency)
+            ############# execute gateways ############
+            sms.execute()
+            webpush.execute()
+
+            ############# start consuming ############
+            if not stopping.is_set():
+                mb.start()
+
+            ############# stop consuming ############
+            if stopping.is_set():
+                mb.close()
+
+        except Exception as err:  # noqa
+            logger.exception(err)
+            if stopping.is_set():
+                mb.close()
+            else:
+                mb.reset_channel()
+                sleep(1)
+
+
+parser = argparse.ArgumentParser(description="Notification subscriber.")
+parser.add_argument("--engine", choices=ENGINES.keys(), default=RABBITMQ_CONSUMER_ENGINE, help="consumer engine.")
+parser.add_argument("--concurrency", type=int, default=RABBITMQ_CONSUMER_CONCURRENCY, help="deliveries handled at once by the threads and asyncio engines.")
+parser.add_argument("--workers", type=int, default=SUPERVISOR_WORKERS, help="consumer processes, more than one runs them under a supervisor.")
+args = parser.parse_args()
+
+setup_logging()
+setup_tracing()
+
+if args.workers > 1:
+    Supervisor(workers=args.workers, target=consume, args=(args,)).run()
+else:
+    consume(args)
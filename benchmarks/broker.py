@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pika
+from src.core.rabbitmq import Exchange
+from src.core.rabbitmq import RabbitMQ
+from src.core.rabbitmq.threaded import ThreadedRabbitMQ
+
+
+class InProcessConnection:
+    """Stand-in for `pika.BlockingConnection`, callbacks handed to the connection thread run at once under a lock."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.is_closed = False
+
+    def add_callback_threadsafe(self, callback):
+        with self._lock:
+            callback()
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, self.add_callback_threadsafe, (callback,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def close(self):
+        self.is_closed = True
+
+
+class InProcessChannel:
+    """Stand-in for a pika channel recording acks, nacks and RPC replies instead of talking to a broker."""
+
+    is_open = True
+
+    def __init__(self):
+        self.acks = 0
+        self.nacks = 0
+        self.replies = []
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.acks += 1  # ack frames, one cumulative ack settles several deliveries
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.nacks += 1
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.replies.append((routing_key, properties.correlation_id if properties else None, time.perf_counter()))
+
+
+class InProcessExchange(Exchange):
+    """Topic exchange routing published bodies straight to the consumers bound on it."""
+
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+        self.bindings = []
+
+    def bind(self, routing_key, auto_ack, queue=None, queue_arguments=None, prefetch_count=0, **callbacks):
+        pattern = re.compile("^" + re.escape(routing_key).replace(r"\*", r"[^.]+").replace(r"\#", r".*") + "$")
+        self.bindings.extend((pattern, callback) for callback in callbacks.values())
+        return True
+
+
+class InProcessBroker:
+    """Engine mixin replacing the broker connection with an in-process topic router.
+
+    Combined with a consumer engine, exp: `type("Engine", (InProcessBroker, ThreadedRabbitMQ), {})`, the real gateway
+    callbacks registered by `src.gateways` are driven through the engine's own dispatch (`_wrap_callback`, `response`)
+    without a RabbitMQ server. `publish` blocks while `window` deliveries are unfinished, like a consumer prefetch.
+    """
+
+    def _configure(self, window=100, **options):
+        self.window = threading.BoundedSemaphore(window)
+        self.completed = []
+        self._delivery_tag = 0
+        return super()._configure(**options)
+
+    def _connect(self):
+        self.connection = InProcessConnection()
+        self.channel = InProcessChannel()
+        self.acks.reset()
+        self._connection_thread = threading.get_ident()
+        return True
+
+    def _create_exchange(self, exchange_name):
+        return InProcessExchange(self.channel, exchange_name)
+
+    def _retry(self, callback, auto_ack, retry):
+        def recorded(channel, method, properties, body):
+            try:
+                return callback(channel, method, properties, body)
+            except Exception as e:  # noqa
+                method.error = e  # handed to the retry topology by the engine, recorded for the report.
+                raise
+
+        return super()._retry(recorded, auto_ack, retry)
+
+    def _wrap_callback(self, callback, auto_ack, max_in_flight=None):
+        def timed(channel, method, properties, body):
+            error = None
+            try:
+                return callback(channel, method, properties, body)
+            except Exception as e:  # noqa
+                error = e
+                raise
+            finally:
+                self.completed.append((method.delivery_tag, method.published_at, time.perf_counter(), error or getattr(method, "error", None)))
+                self.window.release()
+
+        return super()._wrap_callback(timed, auto_ack, max_in_flight)
+
+    def _reject(self, method, auto_ack):
+        if not auto_ack:
+            self._threadsafe(self.acks.nack, method.delivery_tag, requeue=False)
+
+    def publish(self, exchange_name, routing_key, body, properties=None):
+        """
+        Deliver a message to every consumer whose binding matches the routing key.
+
+        Returns:
+            int: The number of consumers the message was delivered to.
+        """
+        exchange = self.get_exchange(exchange_name, notfound_exception=True)
+        delivered = 0
+        for pattern, callback in exchange.bindings:
+            if not pattern.match(routing_key):
+                continue
+            self.window.acquire()
+            self._delivery_tag += 1
+            method = SimpleNamespace(delivery_tag=self._delivery_tag, routing_key=routing_key, exchange=exchange_name, published_at=time.perf_counter())
+            try:
+                # the publishing thread stands in for the connection thread, the lock keeps ack timers off the channel meanwhile.
+                with self.connection._lock:
+                    callback(self.channel, method, properties or pika.BasicProperties(), body)
+            except Exception:  # noqa
+                pass  # the blocking engine raises failed deliveries to the caller, they are already recorded.
+            delivered += 1
+        return delivered
+
+    def drain(self, expected, timeout=300):
+        """
+        Wait until `expected` deliveries have finished.
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.completed) < expected and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return len(self.completed) >= expected
+
+    def start(self):
+        return True
+
+    def reset_channel(self):
+        return True
+
+
+def create_engine(engine, concurrency, window):
+    """
+    Create the `RabbitMQ` singleton as an in-process engine, so `RabbitMQ()` in the gateways returns it.
+
+    Args:
+        engine (str): "blocking" or "threads".
+        concurrency (int): Deliveries handled at once by the threads engine.
+        window (int): Unfinished deliveries `publish` allows.
+    """
+    if hasattr(RabbitMQ, "instance"):
+        del RabbitMQ.instance
+    base = {"blocking": RabbitMQ, "threads": ThreadedRabbitMQ}[engine]
+    return type(f"InProcess{base.__name__}", (InProcessBroker, base), {})(concurrency=concurrency, window=window)
@@ -0,0 +1,50 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare benchmarks/results/a1b2c3d.json benchmarks/results/e4f5a6b.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def percent(value):
+    return "n/a" if value is None else f"{value:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark results.")
+    parser.add_argument("baseline", help="results of the reference commit.")
+    parser.add_argument("candidate", help="results of the commit under test.")
+    parser.add_argument("--threshold", type=float, default=10, help="percent of throughput loss or p99 growth reported as a regression.")
+    options = parser.parse_args(argv)
+
+    with open(options.baseline) as baseline, open(options.candidate) as candidate:
+        before, after = json.load(baseline), json.load(candidate)
+    print(f"{before['revision']} -> {after['revision']}")
+
+    baseline_results = {result["gateway"]: result for result in before["results"]}
+    regressions = []
+    for result in after["results"]:
+        reference = baseline_results.get(result["gateway"])
+        if reference is None:
+            continue
+        throughput = change(reference["messages_per_second"], result["messages_per_second"])
+        p99 = change(reference["latency_ms"]["p99"], result["latency_ms"]["p99"])
+        regressed = (throughput is not None and throughput < -options.threshold) or (p99 is not None and p99 > options.threshold)
+        if regressed:
+            regressions.append(result["gateway"])
+        print(
+            f"{result['gateway']:<28} msg/s {reference['messages_per_second']:>9} -> {result['messages_per_second']:>9} ({percent(throughput)})  "
+            f"p99 {reference['latency_ms']['p99']:>9} -> {result['latency_ms']['p99']:>9} ms ({percent(p99)})" + ("  REGRESSION" if regressed else "")
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
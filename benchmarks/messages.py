@@ -0,0 +1,67 @@
+import json
+
+import pika
+from examiner.message_templates import GOOGLE_WEBPUSH_MESSAGE
+
+CREATED_TIME = "2020-01-01 20:22:00"
+SUBSCRIPTION_KEYS = json.loads(json.loads(GOOGLE_WEBPUSH_MESSAGE)["subscription_info"])["keys"]
+
+
+def phone_number(index):
+    return f"0910{index % 10_000_000:07d}"
+
+
+def single_sms(index, options):
+    return {"application": "BENCH", "created_time": CREATED_TIME, "data": {"receptor": phone_number(index), "message": "benchmark message"}}
+
+
+def group_sms(index, options):
+    receptors = [phone_number(index * options.group_size + offset) for offset in range(options.group_size)]
+    return {"application": "BENCH", "created_time": CREATED_TIME, "data": {"receptor": receptors, "message": "benchmark message"}}
+
+
+def single_otp(index, options):
+    return {"application": "BENCH", "created_time": CREATED_TIME, "data": {"receptor": phone_number(index), "message": f"{index % 10000:04d}"}}
+
+
+def group_otp(index, options):
+    receptors = [phone_number(index * options.group_size + offset) for offset in range(options.group_size)]
+    return {"application": "BENCH", "created_time": CREATED_TIME, "data": {"receptor": receptors, "message": [f"{offset:04d}" for offset in range(options.group_size)]}}
+
+
+def vapid_key(index, options):
+    return {"application": "BENCH", "created_time": CREATED_TIME, "vapid_public_key": True}
+
+
+def google(index, options):
+    subscription_info = {"endpoint": f"{options.urls['push']}/push/{index}", "expirationTime": None, "keys": SUBSCRIPTION_KEYS}
+    data = {"title": "BENCH PUSH", "body": "benchmark push", "icon": "https://example.com/icon.png", "badge": "https://example.com/badge.png"}
+    return {"application": "BENCH", "created_time": CREATED_TIME, "subscription_info": json.dumps(subscription_info), "data": data}
+
+
+def single_chabok(index, options):
+    notification = {"title": "BENCH PUSH", "body": "benchmark push"}
+    return {"application": "BENCH", "created_time": CREATED_TIME, "user": f"user-{index}", "content": "benchmark", "notification": notification}
+
+
+def group_chabok(index, options):
+    notification = {"title": "BENCH PUSH", "body": "benchmark push"}
+    users = [f"user-{index * options.group_size + offset}" for offset in range(options.group_size)]
+    return {"application": "BENCH", "created_time": CREATED_TIME, "users": users, "content": "benchmark", "notification": notification}
+
+
+def rpc_properties(index):
+    return pika.BasicProperties(reply_to="benchmark.replies", correlation_id=str(index))
+
+
+# gateway name: (exchange, routing key, body factory, properties factory)
+GATEWAYS = {
+    "send_single_message": ("sms", "send.single.bench", single_sms, None),
+    "send_group_messages": ("sms", "send.group.bench", group_sms, None),
+    "send_single_otp": ("sms", "send.single.otp.bench", single_otp, None),
+    "send_group_otp": ("sms", "send.group.otp.bench", group_otp, None),
+    "get_public_vapid_key": ("webpush", "get.public.vapid.bench", vapid_key, rpc_properties),
+    "send_google_webpush": ("webpush", "send.google.bench", google, None),
+    "send_single_chabok_webpush": ("webpush", "send.single.chabok.bench", single_chabok, None),
+    "send_group_chabok_webpush": ("webpush", "send.group.chabok.bench", group_chabok, None),
+}
@@ -0,0 +1,77 @@
+import json
+import multiprocessing
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+def kavenegar(path, body):
+    receptors = parse_qs(body.decode("utf-8")).get("receptor", [""])
+    entries = [{"messageid": index, "status": 1, "statustext": "queued", "receptor": receptor} for index, receptor in enumerate(receptors)]
+    return 200, {"return": {"status": 200, "message": "OK"}, "entries": entries}
+
+
+def twilio(path, body):
+    return 201, {"sid": "SM00000000000000000000000000000000", "status": "queued"}
+
+
+def chabok(path, body):
+    return 200, {"count": 1}
+
+
+def push(path, body):
+    return 201, {}
+
+
+PROVIDERS = {"kavenegar": kavenegar, "twilio": twilio, "chabok": chabok, "push": push}
+
+
+class FakeProvider:
+    """Local HTTP server answering like a provider after a fixed latency.
+
+    The server runs in its own process, so serving the fake requests does not compete for the GIL with the consumer
+    being measured.
+
+    Exp:
+        >>> provider = FakeProvider("twilio", latency=120).start()
+        >>> settings.TWILIO_BASE_URL = provider.url
+    """
+
+    def __init__(self, name, latency=0, host="127.0.0.1"):
+        self.name = name
+        self.latency = latency / 1000
+        answer = PROVIDERS[name]
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, as the real providers
+
+            def do_POST(self):  # noqa: N802
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                time.sleep(provider.latency)
+                status, payload = answer(self.path, body)
+                content = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 1024})  # the default backlog of 5 drops connects
+        self.server = server_class((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        self.process = multiprocessing.get_context("fork").Process(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self.process.start()
+        self.server.socket.close()  # the listening socket belongs to the child now
+        return self
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
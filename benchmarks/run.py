@@ -0,0 +1,200 @@
+"""End-to-end throughput benchmark of the gateways against an in-process broker and local fake providers.
+
+Run from the root directory of the project, a throwaway VAPID key pair is generated for every run:
+
+    python -m benchmarks.run --engine threads --messages 2000 --latency 50 --output benchmarks/results/HEAD.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.messages import GATEWAYS
+from benchmarks.providers import FakeProvider
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PublicFormat
+from py_vapid import Vapid
+from py_vapid.utils import b64urlencode
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    # kilobytes on linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def load_settings():
+    """Import the settings with a throwaway VAPID key pair, the fake push service does not check the signatures."""
+    vapid = Vapid()
+    vapid.generate_keys()
+    private_key = vapid.private_key.private_numbers().private_value.to_bytes(32, "big")
+    public_key = vapid.public_key.public_bytes(Encoding.X962, PublicFormat.UncompressedPoint)
+    with tempfile.TemporaryDirectory(prefix="benchmark-vapid-") as directory:
+        for name, key in (("VAPID_PRIVATE_KEY_FILE", private_key), ("VAPID_PUBLIC_KEY_FILE", public_key)):
+            os.environ[name] = os.path.join(directory, name.lower())
+            with open(os.environ[name], "w") as key_file:
+                key_file.write(b64urlencode(key))
+        from src.core import settings  # the keys are read on import
+    return settings
+
+
+def configure(settings, options):
+    """Point every provider at a local fake and keep the benchmark quiet."""
+    latencies = {name: options.latency for name in ("kavenegar", "twilio", "chabok", "push")}
+    for item in options.provider_latency:
+        name, _, latency = item.partition("=")
+        latencies[name] = float(latency)
+    providers = {name: FakeProvider(name, latency).start() for name, latency in latencies.items()}
+    options.urls = {name: provider.url for name, provider in providers.items()}
+
+    settings.KAVEHNEGAR_API_KEY = "BENCHMARK"
+    settings.KAVEHNEGAR_DEDICATED_NUMBER = "10000000"
+    settings.KAVEHNEGAR_OTP_TEMPLATE_NAME = "benchmark"
+    settings.KAVEHNEGAR_BASE_URL = options.urls["kavenegar"]
+    settings.TWILIO_ACCOUNT_SID = "AC" + "0" * 32
+    settings.TWILIO_AUTH_TOKEN = "BENCHMARK"
+    settings.TWILIO_DEDICATED_NUMBER = "+10000000000"
+    settings.TWILIO_BASE_URL = options.urls["twilio"]
+    settings.CHABOK = {"APP_ID": "benchmark", "ACCESS_TOKEN": "BENCHMARK"}
+    settings.CHABOK_BASE_URL = options.urls["chabok"]
+    settings.LOG_LEVEL = "WARNING"
+    settings.RATE_LIMIT_ENABLED = options.rate_limits
+    settings.METRICS_ENABLED = False
+    return providers
+
+
+def run_gateway(mb, name, options):
+    exchange, routing_key, body, properties = GATEWAYS[name]
+    messages = [(json.dumps(body(index, options)).encode("utf-8"), properties(index) if properties else None) for index in range(options.warmup + options.messages)]
+
+    for message, message_properties in messages[: options.warmup]:
+        mb.publish(exchange, routing_key, message, message_properties)
+    mb.drain(options.warmup)
+    mb.completed.clear()
+
+    started = time.perf_counter()
+    for message, message_properties in messages[options.warmup :]:
+        mb.publish(exchange, routing_key, message, message_properties)
+    finished = mb.drain(options.messages, timeout=options.timeout)
+    elapsed = time.perf_counter() - started
+
+    completed = list(mb.completed)
+    latencies = sorted((done - published) * 1000 for _, published, done, _ in completed)
+    errors = [error for *_, error in completed if error is not None]
+    return {
+        "gateway": name,
+        "routing_key": routing_key,
+        "messages": len(completed),
+        "errors": len(errors),
+        "first_error": repr(errors[0]) if errors else None,
+        "timed_out": not finished,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(completed) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def main(argv=None):
+    settings = load_settings()
+
+    parser = argparse.ArgumentParser(description="Notification gateways benchmark.")
+    parser.add_argument("--gateways", nargs="+", choices=GATEWAYS.keys(), default=list(GATEWAYS), help="gateways to benchmark, all by default.")
+    parser.add_argument("--engine", choices=("blocking", "threads"), default="threads", help="consumer engine driving the gateways.")
+    parser.add_argument("--concurrency", type=int, default=settings.RABBITMQ_CONSUMER_CONCURRENCY, help="deliveries handled at once by the threads engine.")
+    parser.add_argument("--window", type=int, default=200, help="unfinished deliveries allowed, like a consumer prefetch.")
+    parser.add_argument("--messages", type=int, default=1000, help="measured messages per gateway.")
+    parser.add_argument("--warmup", type=int, default=50, help="messages per gateway sent before measuring.")
+    parser.add_argument("--group-size", type=int, default=10, help="receptors/users of group messages.")
+    parser.add_argument("--latency", type=float, default=50, help="milliseconds every fake provider waits before answering.")
+    parser.add_argument("--provider-latency", nargs="*", default=[], metavar="PROVIDER=MS", help="per provider latency, exp: twilio=120 push=30.")
+    parser.add_argument("--rate-limits", action="store_true", help="apply the provider rate limits of the settings, off to measure the gateways themselves.")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the deliveries of a gateway.")
+    parser.add_argument("--output", help="path of the JSON results, exp: benchmarks/results/$(git rev-parse --short HEAD).json")
+    options = parser.parse_args(argv)
+
+    providers = configure(settings, options)
+
+    from src.core.log import setup_logging
+    from src.gateways import sms
+    from src.gateways import webpush
+
+    from benchmarks.broker import create_engine
+
+    setup_logging()
+    mb = create_engine(options.engine, options.concurrency, options.window)
+    sms.execute()
+    webpush.execute()
+
+    results = []
+    for name in options.gateways:
+        result = run_gateway(mb, name, options)
+        results.append(result)
+        latency = result["latency_ms"]
+        print(
+            f"{name:<28} {result['messages_per_second']:>9} msg/s  p50 {latency['p50']:>9} ms  p99 {latency['p99']:>9} ms  "
+            f"rss {result['rss_mb']:>7} MB  errors {result['errors']}" + (f" ({result['first_error']})" if result["errors"] else "")
+        )
+
+    report = {
+        "revision": revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "engine": options.engine,
+            "concurrency": options.concurrency,
+            "window": options.window,
+            "messages": options.messages,
+            "warmup": options.warmup,
+            "group_size": options.group_size,
+            "latency_ms": options.latency,
+            "provider_latency_ms": options.provider_latency,
+        },
+        "max_rss_mb": round(max_rss_mb(), 1),
+        "results": results,
+    }
+    if options.output:
+        os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+        with open(options.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"results written to {options.output}")
+
+    for provider in providers.values():
+        provider.stop()
+    return report
+
+
+if __name__ == "__main__":
+    main()
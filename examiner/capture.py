@@ -0,0 +1,154 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import signal
+import time
+
+import pika
+
+PROPERTIES = (
+    "content_type",
+    "content_encoding",
+    "headers",
+    "delivery_mode",
+    "priority",
+    "correlation_id",
+    "reply_to",
+    "expiration",
+    "message_id",
+    "timestamp",
+    "type",
+    "app_id",
+)
+
+
+def _hashed_digits(value, length):
+    return str(int(hashlib.sha256(value.encode("utf-8")).hexdigest(), 16))[-length:].zfill(length)
+
+
+def mask_receptor(receptor):
+    """Replace a phone number with a stable fake one of the same shape, so masked captures still pass the validators."""
+    keep = 4 if receptor.startswith("+") else 3
+    return receptor[:keep] + _hashed_digits(receptor, len(receptor) - keep)
+
+
+def mask_user(user):
+    return f"user-{_hashed_digits(user, 10)}"
+
+
+def mask(body):
+    """
+    Mask the receptors, users and push endpoints of a message body.
+
+    The same receptor is always masked to the same value, so the distribution of recipients is kept.
+    """
+    try:
+        message = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(message, dict):
+        return body
+
+    data = message.get("data")
+    if isinstance(data, dict) and "receptor" in data:
+        receptor = data["receptor"]
+        data["receptor"] = [mask_receptor(str(item)) for item in receptor] if isinstance(receptor, list) else mask_receptor(str(receptor))
+    if isinstance(message.get("user"), str):
+        message["user"] = mask_user(message["user"])
+    if isinstance(message.get("users"), list):
+        message["users"] = [mask_user(str(user)) for user in message["users"]]
+    if isinstance(message.get("subscription_info"), str):
+        try:
+            subscription_info = json.loads(message["subscription_info"])
+            endpoint = subscription_info["endpoint"]
+            subscription_info["endpoint"] = endpoint[: endpoint.rfind("/") + 1] + _hashed_digits(endpoint, 20)
+            message["subscription_info"] = json.dumps(subscription_info)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass
+    return json.dumps(message).encode("utf-8")
+
+
+def encode_properties(properties):
+    encoded = {}
+    for name in PROPERTIES:
+        value = getattr(properties, name, None)
+        if value is not None:
+            encoded[name] = value
+    if "headers" in encoded:
+        encoded["headers"] = {key: value.decode("utf-8", "replace") if isinstance(value, bytes) else value for key, value in encoded["headers"].items()}
+    return encoded
+
+
+def encode_body(body):
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_base64": base64.b64encode(body).decode("ascii")}
+
+
+def read_capture(path):
+    """
+    Yield the deliveries of a capture file as (seconds since the first delivery, exchange, routing key, body, properties).
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as capture:
+        for line in capture:
+            record = json.loads(line)
+            body = record["body"].encode("utf-8") if "body" in record else base64.b64decode(record["body_base64"])
+            yield record["t"], record["exchange"], record["routing_key"], body, record["properties"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture the deliveries of the notification exchanges.")
+    parser.add_argument("output", help="capture file, gzip compressed JSON lines, exp: campaign.jsonl.gz")
+    parser.add_argument("--host", default="localhost", help="RabbitMQ host.")
+    parser.add_argument("--exchanges", nargs="+", default=["sms", "webpush"], help="exchanges to capture.")
+    parser.add_argument("--routing-key", default="#", help="binding of the capture queue, all messages by default.")
+    parser.add_argument("--mask", action="store_true", help="mask receptors, users and push endpoints.")
+    parser.add_argument("--duration", type=float, help="seconds to capture, until CTRL+C if omitted.")
+    options = parser.parse_args()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=options.host))
+    channel = connection.channel()
+    # an exclusive queue of its own gets a copy of every message without taking deliveries away from the consumers.
+    queue = channel.queue_declare(queue="", exclusive=True).method.queue
+    for exchange in options.exchanges:
+        channel.exchange_declare(exchange=exchange, exchange_type="topic")
+        channel.queue_bind(exchange=exchange, queue=queue, routing_key=options.routing_key)
+
+    started = None
+    captured = 0
+    stopping = []
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+
+    with gzip.open(options.output, "wt", encoding="utf-8") as capture:
+
+        def on_message(channel, method, properties, body):
+            nonlocal started, captured
+            arrived = time.time()
+            started = started or arrived
+            record = {
+                "t": round(arrived - started, 6),
+                "time": arrived,
+                "exchange": method.exchange,
+                "routing_key": method.routing_key,
+                "properties": encode_properties(properties),
+                **encode_body(mask(body) if options.mask else body),
+            }
+            capture.write(json.dumps(record) + "\n")
+            captured += 1
+
+        channel.basic_consume(queue=queue, on_message_callback=on_message, auto_ack=True)
+        print(f" [*] Capturing {', '.join(options.exchanges)} into {options.output}. To stop press CTRL+C")
+        deadline = time.monotonic() + options.duration if options.duration else None
+        while not stopping and (deadline is None or time.monotonic() < deadline):
+            connection.process_data_events(time_limit=0.5)
+
+    connection.close()
+    print(f" [x] Captured {captured} messages.")
+
+
+if __name__ == "__main__":
+    main()
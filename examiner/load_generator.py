@@ -0,0 +1,183 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+import uuid
+
+import pika
+from message_templates import CHABOK_GROUP_WEBPUSH_MESSAGE
+from message_templates import CHABOK_SINGLE_WEBPUSH_MESSAGE
+from message_templates import GOOGLE_WEBPUSH_MESSAGE
+from message_templates import GROUP_OTP_MESSAGE
+from message_templates import PUBLIC_VAPID_KEY
+from message_templates import SINGLE_OTP_MESSAGE
+from message_templates import SINGLE_SMS_MESSAGE
+
+# template name: (exchange, routing key, message)
+TEMPLATES = {
+    "single_sms": ("sms", "send.single.load", SINGLE_SMS_MESSAGE),
+    "single_otp": ("sms", "send.single.otp.load", SINGLE_OTP_MESSAGE),
+    "group_otp": ("sms", "send.group.otp.load", GROUP_OTP_MESSAGE),
+    "google": ("webpush", "send.google.load", GOOGLE_WEBPUSH_MESSAGE),
+    "single_chabok": ("webpush", "send.single.chabok.load", CHABOK_SINGLE_WEBPUSH_MESSAGE),
+    "group_chabok": ("webpush", "send.group.chabok.load", CHABOK_GROUP_WEBPUSH_MESSAGE),
+    "vapid": ("webpush", "get.public.vapid.load", PUBLIC_VAPID_KEY),
+}
+
+
+def phone_number(rng):
+    return f"091{rng.randrange(10**8):08d}"
+
+
+def randomize(message, rng, group_size):
+    """Give a template random receptors/users, so deliveries do not all hit the same recipient."""
+    message = json.loads(message)
+    data = message.get("data")
+    if isinstance(data, dict) and "receptor" in data:
+        if isinstance(data["receptor"], list):
+            size = group_size or len(data["receptor"])
+            data["receptor"] = [phone_number(rng) for _ in range(size)]
+            if isinstance(data["message"], list):
+                data["message"] = [f"{rng.randrange(10**4):04d}" for _ in range(size)]
+        else:
+            data["receptor"] = phone_number(rng)
+    if "user" in message:
+        message["user"] = f"user-{rng.randrange(10**6)}"
+    if "users" in message:
+        message["users"] = [f"user-{rng.randrange(10**6)}" for _ in range(group_size or len(message["users"]))]
+    return json.dumps(message)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, round(fraction * (len(values) - 1)))], 3) if values else None
+
+
+class Publisher:
+    """One connection publishing its share of the load and timing the RPC replies it gets."""
+
+    def __init__(self, options, index):
+        self.options = options
+        self.rng = random.Random(options.seed + index if options.seed is not None else None)
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=options.host))
+        self.channel = self.connection.channel()
+        for exchange in {exchange for exchange, _, _ in TEMPLATES.values()}:
+            self.channel.exchange_declare(exchange=exchange, exchange_type="topic")
+
+        self.callback_queue = self.channel.queue_declare(queue="", exclusive=True).method.queue
+        self.channel.basic_consume(queue=self.callback_queue, on_message_callback=self.on_response, auto_ack=True)
+        self.pending = {}
+        self.round_trips = []
+
+    def on_response(self, channel, method, properties, body):
+        sent_at = self.pending.pop(properties.correlation_id, None)
+        if sent_at is not None:
+            self.round_trips.append((time.perf_counter() - sent_at) * 1000)
+
+    def publish(self, name):
+        exchange, routing_key, message = TEMPLATES[name]
+        body = randomize(message, self.rng, self.options.group_size) if self.options.randomize else message
+        # every message gets its own id, so the subscriber does not drop templates published as they are as duplicates.
+        properties = pika.BasicProperties(message_id=uuid.uuid4().hex)
+        if routing_key.startswith("get."):
+            properties.reply_to = self.callback_queue
+            properties.correlation_id = properties.message_id
+            self.pending[properties.correlation_id] = time.perf_counter()
+        self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+
+    def run(self, count, rate, weights):
+        names, cumulative = list(weights), list(weights.values())
+        sent = dict.fromkeys(names, 0)
+        started = time.perf_counter()
+        for number in range(count):
+            if rate:
+                # paced against the start, so a slow publish is caught up instead of lowering the rate.
+                delay = started + number / rate - time.perf_counter()
+                if delay > 0:
+                    self.connection.process_data_events(time_limit=delay)
+            name = self.rng.choices(names, weights=cumulative)[0]
+            self.publish(name)
+            sent[name] += 1
+            if number % 100 == 0:
+                self.connection.process_data_events(time_limit=0)
+        elapsed = time.perf_counter() - started
+
+        deadline = time.monotonic() + self.options.rpc_timeout
+        while self.pending and time.monotonic() < deadline:
+            self.connection.process_data_events(time_limit=0.1)
+        self.connection.close()
+        return {"sent": sent, "elapsed": elapsed, "round_trips": self.round_trips, "lost_replies": len(self.pending)}
+
+
+def publish(options, index, count, rate, weights, results):
+    try:
+        results.put(Publisher(options, index).run(count, rate, weights))
+    except Exception as e:  # noqa
+        results.put({"error": repr(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification load generator.")
+    parser.add_argument("--host", default="localhost", help="RabbitMQ host.")
+    parser.add_argument(
+        "--mix", nargs="+", default=["single_otp=1"], metavar="TEMPLATE=WEIGHT", help=f"templates to publish and their weights, from: {', '.join(TEMPLATES)}."
+    )
+    parser.add_argument("--messages", type=int, default=1000, help="messages published in total.")
+    parser.add_argument("--rate", type=float, default=0, help="target messages/sec over all connections, 0 publishes as a burst.")
+    parser.add_argument("--connections", type=int, default=1, help="connections publishing in parallel, each from its own process.")
+    parser.add_argument("--group-size", type=int, default=0, help="receptors/users of group messages, the template's own count if 0.")
+    parser.add_argument("--no-randomize", dest="randomize", action="store_false", help="publish the templates as they are.")
+    parser.add_argument("--rpc-timeout", type=float, default=10, help="seconds to wait for outstanding RPC replies.")
+    parser.add_argument("--seed", type=int, help="seed of the random receptors/users and template choice.")
+    parser.add_argument("--output", help="path of a JSON summary.")
+    options = parser.parse_args()
+
+    weights = {}
+    for item in options.mix:
+        name, _, weight = item.partition("=")
+        if name not in TEMPLATES:
+            parser.error(f"unknown template '{name}'")
+        weights[name] = float(weight or 1)
+
+    results = multiprocessing.Queue()
+    share, rest = divmod(options.messages, options.connections)
+    processes = [
+        multiprocessing.Process(target=publish, args=(options, index, share + (index < rest), options.rate / options.connections, weights, results))
+        for index in range(options.connections)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    errors = [outcome["error"] for outcome in outcomes if "error" in outcome]
+    if errors:
+        raise SystemExit(f" [!] {len(errors)} of {len(outcomes)} connections failed: {errors[0]}")
+
+    sent = {name: sum(outcome["sent"][name] for outcome in outcomes) for name in weights}
+    round_trips = [rtt for outcome in outcomes for rtt in outcome["round_trips"]]
+    publish_seconds = max(outcome["elapsed"] for outcome in outcomes)
+    summary = {
+        "sent": sent,
+        "total": sum(sent.values()),
+        "seconds": round(elapsed, 3),
+        "publish_rate": round(sum(sent.values()) / publish_seconds, 1) if publish_seconds else None,
+        "rpc_round_trip_ms": {"count": len(round_trips), "p50": percentile(round_trips, 0.5), "p99": percentile(round_trips, 0.99), "max": percentile(round_trips, 1)},
+        "lost_replies": sum(outcome["lost_replies"] for outcome in outcomes),
+    }
+
+    print(f" [x] Sent {summary['total']} messages in {summary['seconds']}s ({summary['publish_rate']} msg/s): {sent}")
+    if round_trips or summary["lost_replies"]:
+        rtt = summary["rpc_round_trip_ms"]
+        print(f" [.] RPC round trip p50 {rtt['p50']} ms, p99 {rtt['p99']} ms, max {rtt['max']} ms, {summary['lost_replies']} replies lost")
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(summary, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import sys
+import uuid
 
 import pika
 from message_templates import CHABOK_GROUP_WEBPUSH_MESSAGE
@@ -16,7 +17,8 @@ channel = connection.channel()
 
 
 channel.exchange_declare(exchange=exchange, exchange_type="topic")
-channel.basic_publish(exchange=exchange, routing_key=f"{routingKey}", body=f"{message}")
+# a new message id per run, the subscriber drops messages whose id or payload it already sent.
+channel.basic_publish(exchange=exchange, routing_key=f"{routingKey}", body=f"{message}", properties=pika.BasicProperties(message_id=str(uuid.uuid4())))
 
 
 print(f" [x] Sent '{message}' message to queue")
@@ -0,0 +1,52 @@
+import argparse
+import time
+import uuid
+
+import pika
+from capture import read_capture
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a capture against the notification exchanges.")
+    parser.add_argument("capture", help="capture file written by capture.py.")
+    parser.add_argument("--host", default="localhost", help="RabbitMQ host.")
+    parser.add_argument("--speed", default="1", help="time scale of the replay, exp: 1, 10, or max to publish without pauses.")
+    parser.add_argument("--exchange-prefix", default="", help="prefix of the exchanges published to, exp: 'staging.'.")
+    parser.add_argument("--keep-message-ids", action="store_true", help="keep the captured message ids, the subscriber then drops the messages it already sent.")
+    options = parser.parse_args()
+    speed = None if options.speed == "max" else float(options.speed)
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=options.host))
+    channel = connection.channel()
+    # RPC requests get their replies here instead of in the queues of the clients that were captured.
+    reply_queue = channel.queue_declare(queue="", exclusive=True).method.queue
+    channel.basic_consume(queue=reply_queue, on_message_callback=lambda *args: None, auto_ack=True)
+    declared = set()
+
+    replayed = 0
+    started = time.perf_counter()
+    for offset, exchange, routing_key, body, properties in read_capture(options.capture):
+        exchange = f"{options.exchange_prefix}{exchange}"
+        if exchange not in declared:
+            channel.exchange_declare(exchange=exchange, exchange_type="topic")
+            declared.add(exchange)
+        if speed:
+            # scheduled against the start of the replay, keeping the captured inter-arrival times.
+            delay = started + offset / speed - time.perf_counter()
+            if delay > 0:
+                connection.process_data_events(time_limit=delay)
+        if properties.get("reply_to"):
+            properties["reply_to"] = reply_queue
+        if not options.keep_message_ids:
+            properties["message_id"] = uuid.uuid4().hex
+        channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=pika.BasicProperties(**properties))
+        replayed += 1
+
+    elapsed = time.perf_counter() - started
+    connection.process_data_events(time_limit=1)
+    connection.close()
+    print(f" [x] Replayed {replayed} messages in {elapsed:.3f}s ({replayed / elapsed if elapsed else 0:.1f} msg/s).")
+
+
+if __name__ == "__main__":
+    main()
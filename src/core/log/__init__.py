@@ -0,0 +1,126 @@
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler
+
+from src.core import settings
+from src.helpers import codec
+
+logger = logging.getLogger("notification")
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as JSON lines, exp: {"time": "2023-02-28T15:30:00.123", "level": "INFO", "message": "..."}"""
+
+    def format(self, record):  # noqa: A003
+        line = {
+            "time": f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exception"] = record.exc_text
+        return codec.dumps(line).decode("utf-8")
+
+
+class SuccessSampler(logging.Filter):
+    """Keep `settings.LOG_SUCCESS_SAMPLE_RATE` of the per-message records logged with `extra={"sample": True}`.
+
+    Only records at or below `settings.LOG_SAMPLE_LEVEL` are sampled, warnings and errors are always kept.
+    """
+
+    def filter(self, record):  # noqa: A003
+        if record.levelno > settings.LOG_SAMPLE_LEVEL or not getattr(record, "sample", False):
+            return True
+        return random.random() < settings.LOG_SUCCESS_SAMPLE_RATE
+
+
+class BatchQueueHandler(QueueHandler):
+    """Hand records to a background writer instead of writing to the stream on the delivery thread.
+
+    The writer drains up to `settings.LOG_BATCH_SIZE` records at a time and writes them with one `write`/`flush`. It is
+    started lazily and again after a fork, and records arriving while `settings.LOG_QUEUE_SIZE` records are pending are
+    dropped and counted rather than blocking a delivery.
+    """
+
+    def __init__(self, stream, formatter):
+        super().__init__(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+        self.stream = stream
+        self.writer_formatter = formatter
+        self.dropped = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # records queued by the parent before a fork belong to the parent's writer.
+                self.queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+                threading.Thread(target=self._write, name="log-writer", daemon=True).start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # formatted on the writer thread, only the exception text has to be captured while it is being handled.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.writer_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            records = [self.queue.get()]
+            try:
+                while len(records) < settings.LOG_BATCH_SIZE:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            lines = [self.writer_formatter.format(record) for record in records]
+            if self.dropped:
+                lines.append(self.writer_formatter.format(logger.makeRecord(logger.name, logging.WARNING, "", 0, f"{self.dropped} log records dropped", None, None)))
+                self.dropped = 0
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except Exception:  # noqa
+                pass
+
+    def flush(self):
+        """
+        Wait until the records queued so far are written, exp: before the process exits.
+        """
+        deadline = time.monotonic() + 5
+        while not self.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def setup_logging():
+    """
+    Route the `notification` logger through the background batch writer.
+
+    Records go to `settings.LOG_FILE` (stdout if None) as JSON lines, or as plain text with `settings.LOG_FORMAT = "text"`.
+    """
+    stream = open(settings.LOG_FILE, "a", encoding="utf-8") if settings.LOG_FILE else sys.stdout
+    formatter = JSONFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    handler = BatchQueueHandler(stream, formatter)
+    handler.addFilter(SuccessSampler())
+
+    logger.handlers = [handler]
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.propagate = False
+    return handler
@@ -0,0 +1,241 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from src.core import settings
+from src.core.log import logger
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    """A metric family with fixed label names, exposed in the Prometheus text format."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _samples(self):
+        with self._lock:
+            return [(f"{self.name}{_labels(self.labelnames, labels)}", value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name} {value}" for name, value in self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labels, value):  # noqa: A003
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets or settings.METRICS_LATENCY_BUCKETS)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[labels] = (counts, total + value)
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Observe the seconds spent in the `with` block, also when it raises.
+
+        Exp:
+            >>> with PROVIDER_LATENCY.time("kavenegar"):
+            ...     kavenegar_api.sms_send(params)
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    def _samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+
+        samples = []
+        names = (*self.labelnames, "le")
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket{_labels(names, (*labels, bound))}", cumulative))
+            samples.append((f"{self.name}_sum{_labels(self.labelnames, labels)}", total))
+            samples.append((f"{self.name}_count{_labels(self.labelnames, labels)}", cumulative))
+        return samples
+
+
+REGISTRY = []
+
+DELIVERIES = Counter(
+    "notification_deliveries_total", "Deliveries per routing key, gateway and outcome (received, sent, partial, failed, invalid).", ("routing_key", "gateway", "outcome")
+)
+IN_FLIGHT = Gauge("notification_deliveries_in_flight", "Deliveries being handled by a gateway.", ("routing_key", "gateway"))
+PROVIDER_LATENCY = Histogram("notification_provider_latency_seconds", "Latency of provider requests (kavenegar, twilio, chabok, google).", ("provider",))
+CONNECTION_STATE = Gauge("notification_rabbitmq_connected", "1 while the RabbitMQ connection is open, 0 otherwise.")
+
+
+def render():
+    """
+    Returns:
+        str: Every registered metric in the Prometheus text exposition format.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def instrument(callback, routing_key):
+    """
+    Count the deliveries of a gateway callback and track the ones in flight.
+
+    A delivery raising an error with an `outcome` is counted by it, exp: "invalid" for the `InvalidMessage` of `Jsonify`
+    and the validators or "partial" for a `PartialFailure` of a group sent to some recipients; any other exception,
+    programming errors included, is counted as failed. The exception is re-raised to the engine either way.
+
+    Args:
+        callback (callable): The gateway callback, `callback(channel, method, properties, body)`, or a coroutine function.
+        routing_key (str): The binding routing key, exp: "send.single.*", used instead of the delivery routing key to
+            keep the number of label values bounded.
+
+    Returns:
+        callable: The instrumented callback.
+    """
+    gateway = getattr(callback, "__name__", repr(callback))
+    labels = (routing_key, gateway)
+
+    def outcome(error):
+        return getattr(error, "outcome", "failed")
+
+    if asyncio.iscoroutinefunction(callback):
+
+        @functools.wraps(callback)
+        async def instrumented(channel, method, properties, body):
+            DELIVERIES.inc(*labels, "received")
+            IN_FLIGHT.inc(*labels)
+            try:
+                result = await callback(channel, method, properties, body)
+            except Exception as e:
+                DELIVERIES.inc(*labels, outcome(e))
+                raise
+            else:
+                DELIVERIES.inc(*labels, "sent")
+                return result
+            finally:
+                IN_FLIGHT.dec(*labels)
+
+    else:
+
+        @functools.wraps(callback)
+        def instrumented(channel, method, properties, body):
+            DELIVERIES.inc(*labels, "received")
+            IN_FLIGHT.inc(*labels)
+            try:
+                result = callback(channel, method, properties, body)
+            except Exception as e:
+                DELIVERIES.inc(*labels, outcome(e))
+                raise
+            else:
+                DELIVERIES.inc(*labels, "sent")
+                return result
+            finally:
+                IN_FLIGHT.dec(*labels)
+
+    return instrumented
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+_server = None
+
+
+def start_metrics_server():
+    """
+    Serve `/metrics` on `settings.METRICS_HOST` from a daemon thread of the current process.
+
+    Every consumer process has its own metrics, so with `--workers N` each one binds the first free port from
+    `settings.METRICS_PORT` on, up to `settings.METRICS_PORT + settings.METRICS_PORT_RANGE`.
+
+    Returns:
+        int: The port the endpoint listens on, or None if every port was taken.
+    """
+    global _server
+    if _server is not None and _server[0] == os.getpid():
+        return _server[1].server_address[1]
+
+    for port in range(settings.METRICS_PORT, settings.METRICS_PORT + settings.METRICS_PORT_RANGE):
+        try:
+            server = ThreadingHTTPServer((settings.METRICS_HOST, port), MetricsHandler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        _server = (os.getpid(), server)
+        logger.info(f"[*] Metrics are served on http://{settings.METRICS_HOST}:{port}/metrics")
+        return port
+
+    logger.warning("[*] No free port for the metrics endpoint.")
+    return None
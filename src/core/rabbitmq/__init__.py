@@ -1,26 +1,162 @@
+import asyncio
+import copy
+import functools
+import re
+
 import pika
 from src.core import settings
+from src.core.log import logger
+from src.core.metrics import CONNECTION_STATE
+from src.core.metrics import instrument
+from src.core.rabbitmq.acks import AckManager
+from src.core.rabbitmq.retry import FAILED_DELIVERIES
+from src.core.rabbitmq.retry import PartialFailure
+from src.core.rabbitmq.retry import RetryTopology
+from src.core.tracing import span
+from src.core.tracing import trace_delivery
 
 
 class RabbitMQ:
-    def __new__(cls):
-        if not hasattr(cls, "instance"):
-            cls.instance = super(RabbitMQ, cls).__new__(cls)
-            cls.instance._exchanges = []
-            cls.instance._connect()
-        return cls.instance
+    def __new__(cls, **options):
+        # the singleton lives on the base class, so gateways calling `RabbitMQ()` share the engine chosen in `__main__.py`.
+        if not hasattr(RabbitMQ, "instance"):
+            RabbitMQ.instance = super(RabbitMQ, cls).__new__(cls)
+            RabbitMQ.instance._exchanges = []
+            RabbitMQ.instance.acks = AckManager(RabbitMQ.instance)
+            RabbitMQ.instance._configure(**options)
+            RabbitMQ.instance._connect()
+        return RabbitMQ.instance
+
+    def _configure(self, **options):
+        return True
 
     def _connect(self):
         self.connection = pika.BlockingConnection(pika.ConnectionParameters(settings.RABBITMQ_HOST))
         self.channel = self.connection.channel()
+        self.acks.reset()
+        if settings.RABBITMQ_RPC_CONFIRMS:
+            # a blocking channel waits for the confirm of every publish, confirms are only batched by the asyncio engine.
+            logger.warning("RPC reply confirms need the asyncio engine, replies are published unconfirmed.")
+        CONNECTION_STATE.set(value=1)
         return True
 
+    def _threadsafe(self, func, *args, **kwargs):
+        """
+        Run a channel operation on the thread that owns the connection.
+
+        The blocking engine runs callbacks on the connection thread, so the operation is executed immediately.
+        """
+        return func(*args, **kwargs)
+
+    def _call_later(self, delay, func):
+        """
+        Schedule `func` on the thread that owns the connection after `delay` seconds, must be called from that thread.
+        """
+        return self.connection.call_later(delay, func)
+
+    def _track(self, callback, auto_ack):
+        """
+        Register the deliveries of manual-ack consumers with the ack manager before the engine dispatches them.
+        """
+        if auto_ack:
+            return callback
+
+        def on_message(channel, method, properties, body):
+            self.acks.track(method.delivery_tag)
+            return callback(channel, method, properties, body)
+
+        return on_message
+
+    def _retry(self, callback, auto_ack, retry):
+        """
+        Hand the deliveries a gateway callback fails on to `_fail` instead of raising them to the engine, so one bad
+        message neither resets the channel nor stalls the other gateways. Broker errors are still raised.
+        """
+        if asyncio.iscoroutinefunction(callback):
+
+            @functools.wraps(callback)
+            async def guarded(channel, method, properties, body):
+                try:
+                    return await callback(channel, method, properties, body)
+                except pika.exceptions.AMQPError:
+                    raise
+                except Exception as e:  # noqa
+                    self._fail(e, method, properties, body, auto_ack, retry)
+
+        else:
+
+            @functools.wraps(callback)
+            def guarded(channel, method, properties, body):
+                try:
+                    return callback(channel, method, properties, body)
+                except pika.exceptions.AMQPError:
+                    raise
+                except Exception as e:  # noqa
+                    self._fail(e, method, properties, body, auto_ack, retry)
+
+        return guarded
+
+    def _fail(self, error, method, properties, body, auto_ack, retry):
+        """
+        Publish a failed delivery to the retry queue of its attempt or to the parking queue, then ack it.
+
+        The attempt travels in the `x-retry-attempt` header. A `PartialFailure` publishes its narrowed body instead of
+        the delivery. Deliveries of queues without a retry topology (exclusive queues or `settings.RABBITMQ_RETRY_ENABLED`
+        off) are rejected.
+        """
+        if retry is None:
+            logger.exception("Delivery %s failed, rejected.", method.delivery_tag)
+            FAILED_DELIVERIES.inc(method.exchange, "dropped")
+            if not auto_ack:
+                self._threadsafe(self.acks.nack, method.delivery_tag, requeue=False)
+            return
+
+        headers = dict(properties.headers or {})
+        attempt = headers.get("x-retry-attempt", 0)
+        destination = retry.route(error, attempt)
+        logger.exception("Delivery %s failed on attempt %s, published to %s.", method.delivery_tag, attempt + 1, destination)
+        FAILED_DELIVERIES.inc(retry.queue, "parked" if destination == retry.parking_queue else "retry")
+
+        headers.setdefault("x-original-exchange", method.exchange)
+        headers.setdefault("x-original-routing-key", method.routing_key)
+        headers.update({"x-retry-attempt": attempt + 1, "x-error": str(error)[:1000]})
+        properties = copy.copy(properties)
+        properties.headers = headers
+        properties.delivery_mode = pika.spec.PERSISTENT_DELIVERY_MODE
+        body = error.body if isinstance(error, PartialFailure) else body
+        self._threadsafe(self._forward, destination, properties, body, method.delivery_tag)
+
+    def _forward(self, queue, properties, body, delivery_tag):
+        # published before the ack, a connection lost in between redelivers the message instead of losing it.
+        self.acks.publish(exchange="", routing_key=queue, properties=properties, body=body)
+        self.acks.ack(delivery_tag)
+
+    def _wrap_callback(self, callback, auto_ack, max_in_flight=None):
+        """
+        Adapt a gateway callback to the engine, the blocking engine consumes with the callback itself.
+
+        `max_in_flight` bounds the deliveries of one gateway handled at once by the concurrent engines, the blocking
+        engine never handles more than one.
+        """
+        return callback
+
+    def _reject(self, method, auto_ack):
+        """
+        Report a failed delivery of a concurrent engine and reject it, so one bad message does not reset the channel.
+        """
+        logger.exception("Delivery %s failed.", method.delivery_tag)
+        if not auto_ack:
+            self._threadsafe(self.acks.nack, method.delivery_tag, requeue=False)
+
     def add_exchange(self, exchange_name):
         self.get_exchange(exchange_name, exist_exception=True)
-        obj = Exchange(self.channel, exchange_name)
+        obj = self._create_exchange(exchange_name)
         self._exchanges.append(obj)
         return True
 
+    def _create_exchange(self, exchange_name):
+        return Exchange(self.channel, exchange_name)
+
     def get_exchange(self, exchange_name, notfound_exception=False, exist_exception=False):
         for exchange in self._exchanges:
             if exchange.name == exchange_name:
@@ -31,18 +167,34 @@ class RabbitMQ:
         if notfound_exception:
             raise Exception("Exchange not found.")
 
-    def add_callbacks(self, exchange_name, routing_key, auto_ack, **callbacks):
+    def add_callbacks(self, exchange_name, routing_key, auto_ack, queue=None, queue_arguments=None, prefetch_count=None, max_in_flight=None, **callbacks):
         exchange = self.get_exchange(exchange_name, notfound_exception=True)
-        exchange.bind(routing_key, auto_ack, **callbacks)
+        prefetch_count = settings.RABBITMQ_PREFETCH_COUNT if prefetch_count is None else prefetch_count
+        max_in_flight = settings.RABBITMQ_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        retry = exchange.retry_topology(routing_key, queue=queue, queue_arguments=queue_arguments)
+        wrapped = {}
+        for name, callback in callbacks.items():
+            callback = self._retry(instrument(trace_delivery(callback, routing_key), routing_key), auto_ack, retry)
+            wrapped[name] = self._track(self._wrap_callback(callback, auto_ack, max_in_flight), auto_ack)
+        callbacks = wrapped
+        exchange.bind(routing_key, auto_ack, queue=queue, queue_arguments=queue_arguments, prefetch_count=prefetch_count, **callbacks)
         return True
 
     def response(self, ack=None, msg_to_console=None, msg_to_log=None, rpc=None, rpc_msg=None, rpc_exchange=None, rpc_reply_to=None, rpc_correlation_id=None):
+        with span("respond"):
+            self._respond(ack, rpc, rpc_msg, rpc_exchange, rpc_reply_to, rpc_correlation_id)
 
+        if msg_to_console is not None:
+            # per-message success records, sampled by `settings.LOG_SUCCESS_SAMPLE_RATE`.
+            logger.info(msg_to_console, extra={"sample": True})
+
+    def _respond(self, ack, rpc, rpc_msg, rpc_exchange, rpc_reply_to, rpc_correlation_id):
         if rpc is not None:
             if not all([rpc, rpc_msg, rpc_reply_to, rpc_correlation_id]):
                 raise ValueError("rpc metadata include {`rpc_msg`, `rpc_correlation_id`, `rpc_replay_to`, `rpc_exchange` are not mentioned}")
 
-            self.channel.basic_publish(
+            self._threadsafe(
+                self.acks.publish,
                 exchange=rpc_exchange,
                 routing_key=rpc_reply_to,
                 properties=pika.BasicProperties(correlation_id=rpc_correlation_id),
@@ -50,23 +202,53 @@ class RabbitMQ:
             )
 
         if ack is not None:
-            self.channel.basic_ack(delivery_tag=ack)
-
-        if msg_to_console is not None:
-            print(msg_to_console)
+            # deliveries of `auto_ack=True` consumers are dropped by the ack manager, they are already acked by the broker.
+            self._threadsafe(self.acks.ack, ack)
 
     def start(self):
-        print("[*] Waiting for messages. To exit press CTRL+C")
+        logger.info("[*] Waiting for messages. To exit press CTRL+C")
         self.channel.start_consuming()
 
+    def stop(self):
+        """
+        Ask the engine to stop consuming, `start` returns once the broker cancelled the consumers.
+
+        Safe to call from a signal handler or another thread, the deliveries in flight are finished by `close`.
+        """
+        if self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def close(self):
+        """
+        Shut the engine down once `start` returned: finish the deliveries in flight, ack them and close the connection.
+
+        Deliveries that were received but not handled stay unacked and are redelivered by the broker.
+        """
+        logger.info("[*] Closing the connection.")
+        CONNECTION_STATE.set(value=0)
+        self._drain()
+        if self.channel.is_open:
+            self.acks.flush()
+        if self.connection.is_open:
+            self.connection.close()
+        return True
+
+    def _drain(self):
+        """
+        Wait for the deliveries in flight, the blocking engine handles them on the connection thread so none are left.
+        """
+        return True
+
     def reset_channel(self):
-        print("[*] Waiting for reset channel.")
+        logger.info("[*] Waiting for reset channel.")
+        CONNECTION_STATE.set(value=0)
         if self.channel.is_open:
+            self.acks.flush()
             self.connection.close()
             self._connect()
 
         self._exchanges = []
-        print("[*] Channel reset successfully.")
+        logger.info("[*] Channel reset successfully.")
         return True
 
 
@@ -77,11 +259,64 @@ class Exchange:
         self.name = name
         self.channel.exchange_declare(exchange=self.name, exchange_type="topic")
 
-    def bind(self, routing_key, auto_ack, **callbacks):
-        result = self.channel.queue_declare(queue="", exclusive=True)
+    def bind(self, routing_key, auto_ack, queue=None, queue_arguments=None, prefetch_count=0, **callbacks):
+        result = self.channel.queue_declare(**self.queue_declaration(routing_key, queue, queue_arguments))
         self.bind_queue = result.method.queue
         self.channel.queue_bind(exchange=self.name, queue=self.bind_queue, routing_key=routing_key)
+        retry = self.retry_topology(routing_key, queue=queue, queue_arguments=queue_arguments)
+        for declaration in retry.declarations() if retry is not None else []:
+            self.channel.queue_declare(**declaration)
 
+        # per consumer prefetch, it applies to the consumers started after it on this channel.
+        self.channel.basic_qos(prefetch_count=prefetch_count)
         for _, callback in callbacks.items():
             self.channel.basic_consume(queue=self.bind_queue, auto_ack=auto_ack, on_message_callback=callback)
         return True
+
+    def queue_declaration(self, routing_key, queue=None, queue_arguments=None):
+        """
+        Build the `queue_declare` arguments of a binding.
+
+        Bindings consume from a named durable queue shared by every replica, so replicas compete for messages instead of
+        each receiving a copy, and messages published while no consumer is connected wait in the queue. The name and
+        arguments come from `queue`/`queue_arguments`, then from `settings.RABBITMQ_QUEUES`, then from the defaults.
+
+        Args:
+            routing_key (str): The routing key of the binding.
+            queue (str, optional): The queue name.
+            queue_arguments (dict, optional): Extra queue arguments, exp: {"x-max-length": 100000}.
+
+        Returns:
+            dict: Keyword arguments for `channel.queue_declare`.
+
+        Exp:
+            >>> Exchange(channel, "sms").queue_declaration("send.single.otp.*")
+            {'queue': 'notification.sms.send.single.otp', 'durable': True, 'arguments': {}}
+        """
+        if queue is None and not settings.RABBITMQ_SHARED_QUEUES:
+            return {"queue": "", "exclusive": True}
+
+        override = settings.RABBITMQ_QUEUES.get(f"{self.name}:{routing_key}", {})
+        name = queue or override.get("name") or settings.RABBITMQ_QUEUE_NAME.format(exchange=self.name, routing_key=re.sub(r"\.[*#]", "", routing_key))
+        arguments = {**settings.RABBITMQ_QUEUE_ARGUMENTS, **override.get("arguments", {}), **(queue_arguments or {})}
+        return {"queue": name, "durable": True, "arguments": arguments}
+
+    def retry_topology(self, routing_key, queue=None, queue_arguments=None):
+        """
+        Build the retry topology of a binding.
+
+        Args:
+            routing_key (str): The routing key of the binding.
+            queue (str, optional): The queue name.
+            queue_arguments (dict, optional): Extra queue arguments.
+
+        Returns:
+            RetryTopology: The retry and parking queues of the binding queue, None for exclusive queues, whose
+                server-named queues do not outlive the connection, or if `settings.RABBITMQ_RETRY_ENABLED` is off.
+        """
+        declaration = self.queue_declaration(routing_key, queue, queue_arguments)
+        if not settings.RABBITMQ_RETRY_ENABLED or declaration.get("exclusive"):
+            return None
+
+        override = settings.RABBITMQ_QUEUES.get(f"{self.name}:{routing_key}", {})
+        return RetryTopology(declaration["queue"], override.get("retry_delays", settings.RABBITMQ_RETRY_DELAYS))
@@ -0,0 +1,113 @@
+from pika.spec import Basic
+from src.core import settings
+from src.core.log import logger
+
+
+class AckManager:
+    """Acks and RPC reply confirms of one consumer channel.
+
+    Only deliveries of manual-ack consumers are tracked, so `ack`/`nack` of a delivery consumed with `auto_ack=True`
+    is dropped instead of raising a `PRECONDITION_FAILED - unknown delivery tag` channel error that resets the channel.
+
+    Finished deliveries are acked together once `settings.RABBITMQ_ACK_BATCH_SIZE` of them are pending or the oldest
+    has waited `settings.RABBITMQ_ACK_BATCH_WINDOW` milliseconds. Deliveries of concurrent engines finish out of order,
+    so one cumulative `multiple=True` ack covers the finished deliveries below the oldest one still being handled, and
+    the ones above it are acked on their own. A delivery is never acked before it is handled.
+
+    RPC replies and retried deliveries published with `publish` are tracked by publish sequence number when the channel is in confirm mode,
+    the broker confirms them in cumulative batches and nacked replies are logged.
+
+    Every method must run on the thread that owns the channel, callers go through `RabbitMQ._threadsafe`.
+    """
+
+    def __init__(self, mb):
+        self.mb = mb
+        self.reset()
+
+    def reset(self, confirms=False):
+        """
+        Forget the state of the previous channel, delivery tags and publish sequence numbers restart on a new one.
+
+        Args:
+            confirms (bool): The new channel is in confirm mode.
+        """
+        self._outstanding = set()
+        self._finished = []
+        self._timer = None
+        self.confirms = confirms
+        self._published = 0
+        self._unconfirmed = {}
+
+    def track(self, delivery_tag):
+        """Register a delivery of a manual-ack consumer as it is received."""
+        self._outstanding.add(delivery_tag)
+
+    def ack(self, delivery_tag):
+        """
+        Ack a handled delivery, batched with the other finished deliveries of the channel.
+
+        Returns:
+            bool: False if the delivery is not awaiting an ack (auto-acked, already acked or from a previous channel).
+        """
+        if delivery_tag not in self._outstanding:
+            return False
+
+        self._outstanding.discard(delivery_tag)
+        self._finished.append(delivery_tag)
+        if len(self._finished) >= settings.RABBITMQ_ACK_BATCH_SIZE:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.mb._call_later(settings.RABBITMQ_ACK_BATCH_WINDOW / 1000, self._on_timer)
+        return True
+
+    def nack(self, delivery_tag, requeue=False):
+        """
+        Reject a delivery right away.
+
+        Returns:
+            bool: False if the delivery is not awaiting an ack.
+        """
+        if delivery_tag not in self._outstanding:
+            return False
+
+        self._outstanding.discard(delivery_tag)
+        self.mb.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+        return True
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Ack every finished delivery, with as few frames as the deliveries still being handled allow."""
+        if not self._finished or not self.mb.channel.is_open:
+            return
+
+        finished = sorted(self._finished)
+        self._finished = []
+        oldest = min(self._outstanding, default=None)
+        covered = [tag for tag in finished if oldest is None or tag < oldest]
+        if covered:
+            self.mb.channel.basic_ack(delivery_tag=covered[-1], multiple=len(covered) > 1)
+        for delivery_tag in finished[len(covered) :]:
+            self.mb.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def publish(self, exchange, routing_key, properties, body):
+        """Publish a message (an RPC reply or a retried delivery), tracked until the broker confirms it when the channel is in confirm mode."""
+        self.mb.channel.basic_publish(exchange=exchange, routing_key=routing_key, properties=properties, body=body)
+        if self.confirms:
+            self._published += 1
+            self._unconfirmed[self._published] = (routing_key, properties.correlation_id)
+
+    def on_confirm(self, frame):
+        """Settle the replies covered by a `Basic.Ack`/`Basic.Nack` of the broker."""
+        method = frame.method
+        if method.multiple:
+            settled = [number for number in self._unconfirmed if number <= method.delivery_tag]
+        else:
+            settled = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+
+        for number in settled:
+            routing_key, correlation_id = self._unconfirmed.pop(number)
+            if isinstance(method, Basic.Nack):
+                logger.warning("Message %s to %s was nacked by the broker.", correlation_id, routing_key)
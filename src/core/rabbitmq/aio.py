@@ -0,0 +1,206 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from src.core import settings
+from src.core.log import logger
+from src.core.metrics import CONNECTION_STATE
+from src.core.rabbitmq import Exchange
+from src.core.rabbitmq import RabbitMQ
+
+
+class AsyncioRabbitMQ(RabbitMQ):
+    """RabbitMQ consumer engine driven by an asyncio event loop.
+
+    Deliveries are dispatched as tasks, so a slow provider call no longer holds back the rest of the queue. At most
+    `concurrency` deliveries are handled at once; coroutine callbacks are awaited on the loop and the existing blocking
+    gateway callbacks run on a thread pool of the same size. Each callback acks its own delivery through `response`,
+    which hands the channel operation back to the loop.
+
+    Exchanges and bindings registered through `add_exchange`/`add_callbacks` are recorded and declared as soon as the
+    channel is open, so gateways are registered exactly the same way as with the blocking engine.
+    """
+
+    def _configure(self, concurrency=None, **options):
+        self.concurrency = concurrency or settings.RABBITMQ_CONSUMER_CONCURRENCY
+        return True
+
+    def _connect(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gateway")
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.channel = None
+        self._tasks = set()
+        self._loop_thread = None
+        self._closing = False
+        self._error = None
+        self.connection = AsyncioConnection(
+            pika.ConnectionParameters(settings.RABBITMQ_HOST),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self.loop,
+        )
+        return True
+
+    def _on_connection_open(self, connection):
+        CONNECTION_STATE.set(value=1)
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        CONNECTION_STATE.set(value=0)
+        self._error = error
+        self.loop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        CONNECTION_STATE.set(value=0)
+        if not self._closing:
+            self._error = reason
+        self.loop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        self.channel.add_on_close_callback(self._on_channel_closed)
+        self.acks.reset(confirms=settings.RABBITMQ_RPC_CONFIRMS)
+        if settings.RABBITMQ_RPC_CONFIRMS:
+            self.channel.confirm_delivery(self.acks.on_confirm)
+        for exchange in self._exchanges:
+            exchange.declare(channel)
+
+    def _on_channel_closed(self, channel, reason):
+        if self.connection.is_open:
+            self._error = reason
+            self.connection.close()
+
+    def _threadsafe(self, func, *args, **kwargs):
+        if threading.get_ident() == self._loop_thread:
+            return func(*args, **kwargs)
+        self.loop.call_soon_threadsafe(partial(func, *args, **kwargs))
+
+    def _call_later(self, delay, func):
+        return self.loop.call_later(delay, func)
+
+    def _wrap_callback(self, callback, auto_ack, max_in_flight=None):
+        lane = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+        def on_message(channel, method, properties, body):
+            task = self.loop.create_task(self._deliver(callback, auto_ack, lane, channel, method, properties, body))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return on_message
+
+    async def _deliver(self, callback, auto_ack, lane, channel, method, properties, body):
+        if lane is not None:
+            # wait for a slot of the gateway before taking one of the engine, so a saturated gateway does not starve others.
+            async with lane:
+                return await self._deliver(callback, auto_ack, None, channel, method, properties, body)
+
+        async with self.semaphore:
+            try:
+                if asyncio.iscoroutinefunction(callback):
+                    await callback(channel, method, properties, body)
+                else:
+                    await self.loop.run_in_executor(self.executor, callback, channel, method, properties, body)
+            except Exception:  # noqa
+                self._reject(method, auto_ack)
+
+    def _create_exchange(self, exchange_name):
+        return AsyncioExchange(self.channel, exchange_name)
+
+    def start(self):
+        logger.info("[*] Waiting for messages. To exit press CTRL+C")
+        self._loop_thread = threading.get_ident()
+        self.loop.run_forever()
+        if self._error is not None:
+            raise Exception(f"Connection lost: {self._error!r}")
+
+    def stop(self):
+        # `start` returns once the loop stopped, safe from a signal handler or another thread.
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def close(self):
+        logger.info("[*] Closing the connection.")
+        self._shutdown()
+        return True
+
+    def _shutdown(self):
+        self._closing = True
+        if not (self.connection.is_closed or self.connection.is_closing):
+            if self.channel is not None and self.channel.is_open:
+                for consumer_tag in list(self.channel.consumer_tags):
+                    self.channel.basic_cancel(consumer_tag)
+                while self._tasks:
+                    # finish the deliveries in flight, the acks they hand back to the loop run while it waits.
+                    self.loop.run_until_complete(asyncio.wait(set(self._tasks)))
+                self.acks.flush()
+            self.connection.close()
+            self.loop.run_forever()  # until `_on_connection_closed` stops the loop
+        self.executor.shutdown(wait=True)
+        self.loop.close()
+
+    def reset_channel(self):
+        logger.info("[*] Waiting for reset channel.")
+        self._shutdown()
+        self._connect()
+
+        self._exchanges = []
+        logger.info("[*] Channel reset successfully.")
+        return True
+
+
+class AsyncioExchange(Exchange):
+    """Topic exchange whose declarations are replayed on the asynchronous channel once it is open."""
+
+    def __init__(self, channel, name):
+        self.bind_queue = None
+        self.channel = None
+        self.name = name
+        self._bindings = []
+        self._declared = False
+        if channel is not None:
+            self.declare(channel)
+
+    def declare(self, channel):
+        self.channel = channel
+        self._declared = False
+        self.channel.exchange_declare(exchange=self.name, exchange_type="topic", callback=self._on_exchange_declared)
+
+    def _on_exchange_declared(self, frame):
+        self._declared = True
+        for binding in self._bindings:
+            self._declare_binding(*binding)
+
+    def bind(self, routing_key, auto_ack, queue=None, queue_arguments=None, prefetch_count=0, **callbacks):
+        binding = (
+            routing_key,
+            auto_ack,
+            self.queue_declaration(routing_key, queue, queue_arguments),
+            self.retry_topology(routing_key, queue=queue, queue_arguments=queue_arguments),
+            prefetch_count,
+            callbacks,
+        )
+        self._bindings.append(binding)
+        if self._declared:
+            self._declare_binding(*binding)
+        return True
+
+    def _declare_binding(self, routing_key, auto_ack, declaration, retry, prefetch_count, callbacks):
+        def on_queue_declared(frame):
+            self.bind_queue = frame.method.queue
+            for retry_declaration in retry.declarations() if retry is not None else []:
+                self.channel.queue_declare(**retry_declaration)
+            self.channel.queue_bind(exchange=self.name, queue=frame.method.queue, routing_key=routing_key, callback=partial(on_queue_bound, frame.method.queue))
+
+        def on_queue_bound(queue, frame):
+            self.channel.basic_qos(prefetch_count=prefetch_count, callback=partial(on_qos_set, queue))
+
+        def on_qos_set(queue, frame):
+            for _, callback in callbacks.items():
+                self.channel.basic_consume(queue=queue, auto_ack=auto_ack, on_message_callback=callback)
+
+        self.channel.queue_declare(callback=on_queue_declared, **declaration)
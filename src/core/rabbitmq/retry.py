@@ -0,0 +1,152 @@
+import re
+import socket
+
+import requests
+from src.core import settings
+from src.core.metrics import Counter
+
+FAILED_DELIVERIES = Counter(
+    "notification_failed_deliveries_total", "Failed deliveries per gateway queue and destination (retry, parked, dropped).", ("queue", "destination")
+)
+
+RETRYABLE = "retryable"
+PERMANENT = "permanent"
+
+# provider errors are re-raised as `Exception(f"...: {e}")`, the status of kavenegar and chabok errors is only in the message.
+_STATUS_PATTERN = re.compile(r"APIException\[(\d+)\]|status code (\d+)")
+
+
+class PartialFailure(Exception):
+    """Raised by a gateway callback whose message was sent to some of its recipients only.
+
+    The retry topology publishes `body`, the message narrowed down to the unsent recipients, in place of the delivery,
+    so the recipients already sent are not sent twice. It is retryable if the error of any unsent recipient is.
+
+    Args:
+        message (str): The report of the delivery, exp: the sent and the failed recipients.
+        body (bytes): The message with the unsent recipients only.
+        errors (dict): The error of every unsent recipient.
+        succeeded (list, optional): The recipients already sent.
+    """
+
+    def __init__(self, message, body, errors, succeeded=()):
+        super().__init__(message)
+        self.body = body
+        self.errors = errors
+        self.succeeded = list(succeeded)
+
+    @property
+    def outcome(self):
+        # the delivery outcome counted by `src.core.metrics.instrument`
+        return "partial" if self.succeeded else "failed"
+
+
+def error_status(error):
+    """
+    Find the provider status of an error, or of one it was raised from.
+
+    Args:
+        error (Exception): The error raised by a gateway callback.
+
+    Returns:
+        int: The HTTP status of Twilio, webpush and chabok errors or the `return.status` of kavenegar errors, or None.
+    """
+    while error is not None:
+        status = getattr(error, "status", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is None:
+            match = _STATUS_PATTERN.search(str(error))
+            status = match and int(match.group(1) or match.group(2))
+        if status:
+            return int(status)
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def classify(error):
+    """
+    Classify an error of a gateway callback as retryable or permanent.
+
+    Invalid messages (the ValueError/TypeError of `Jsonify` and the validators) and provider statuses that fail the same
+    way on every attempt (exp: kavenegar 411 invalid receptor, webpush 410 gone) are permanent. Timeouts, connection
+    errors, `settings.RETRYABLE_STATUSES` (exp: 429 and 5xx) and errors without a status are retryable. A
+    `PartialFailure` is retryable if the error of any of its unsent recipients is.
+
+    Args:
+        error (Exception): The error raised by a gateway callback.
+
+    Returns:
+        str: RETRYABLE or PERMANENT.
+    """
+    if isinstance(error, PartialFailure):
+        return RETRYABLE if any(classify(e) == RETRYABLE for e in error.errors.values()) else PERMANENT
+
+    if isinstance(error, (ValueError, TypeError)):
+        return PERMANENT
+
+    cause = error
+    while cause is not None:
+        if isinstance(cause, (TimeoutError, socket.timeout, ConnectionError, requests.Timeout, requests.ConnectionError)):
+            return RETRYABLE
+        cause = cause.__cause__ or cause.__context__
+
+    status = error_status(error)
+    if status is None or status in settings.RETRYABLE_STATUSES:
+        return RETRYABLE
+    return PERMANENT
+
+
+class RetryTopology:
+    """Retry and parking queues of a gateway queue.
+
+    A failed delivery is published to the retry queue of its attempt, a durable queue without consumers whose
+    `x-message-ttl` is the backoff delay of the tier; once the delay expires the broker dead-letters the message through
+    the default exchange back to the gateway queue. Permanent failures and deliveries failing after the last tier are
+    published to the parking queue, where they wait for an operator.
+
+    Exp:
+        >>> RetryTopology("notification.sms.send.single", [1, 5, 25]).route(TimeoutError(), attempt=1)
+        'notification.sms.send.single.retry.5'
+    """
+
+    def __init__(self, queue, delays):
+        self.queue = queue
+        self.delays = list(delays)
+
+    @property
+    def parking_queue(self):
+        return settings.RABBITMQ_PARKING_QUEUE_NAME.format(queue=self.queue)
+
+    def retry_queue(self, delay):
+        return settings.RABBITMQ_RETRY_QUEUE_NAME.format(queue=self.queue, delay=delay)
+
+    def declarations(self):
+        """
+        Returns:
+            list: Keyword arguments for `channel.queue_declare` of every retry queue and of the parking queue.
+        """
+        declarations = [
+            {
+                "queue": self.retry_queue(delay),
+                "durable": True,
+                "arguments": {"x-message-ttl": int(delay * 1000), "x-dead-letter-exchange": "", "x-dead-letter-routing-key": self.queue},
+            }
+            for delay in self.delays
+        ]
+        return [*declarations, {"queue": self.parking_queue, "durable": True, "arguments": {}}]
+
+    def route(self, error, attempt):
+        """
+        Pick the queue a failed delivery is published to.
+
+        Args:
+            error (Exception): The error raised by the gateway callback.
+            attempt (int): The retries the delivery already went through.
+
+        Returns:
+            str: The name of the retry queue or of the parking queue.
+        """
+        if classify(error) == PERMANENT or attempt >= len(self.delays):
+            return self.parking_queue
+        return self.retry_queue(self.delays[attempt])
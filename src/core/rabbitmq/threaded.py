@@ -0,0 +1,106 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from src.core import settings
+from src.core.rabbitmq import RabbitMQ
+
+
+class ThreadedRabbitMQ(RabbitMQ):
+    """RabbitMQ consumer engine that runs gateway callbacks on a bounded worker pool.
+
+    The `BlockingConnection` stays on the main thread and keeps servicing heartbeats while providers are called, so long
+    Kavenegar/Twilio/webpush requests no longer get the connection dropped by the broker. Acks and RPC replies issued
+    through `response` from a worker are handed back to the connection thread with `add_callback_threadsafe`, because
+    pika channels are not thread safe.
+    """
+
+    def _configure(self, concurrency=None, **options):
+        self.concurrency = concurrency or settings.RABBITMQ_CONSUMER_CONCURRENCY
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gateway")
+        return True
+
+    def _connect(self):
+        super()._connect()
+        self._connection_thread = threading.get_ident()
+        return True
+
+    def _threadsafe(self, func, *args, **kwargs):
+        if threading.get_ident() == self._connection_thread:
+            return func(*args, **kwargs)
+        self.connection.add_callback_threadsafe(partial(func, *args, **kwargs))
+
+    def _wrap_callback(self, callback, auto_ack, max_in_flight=None):
+        lane = Lane(max_in_flight)
+
+        def on_message(channel, method, properties, body):
+            if lane.enter((callback, auto_ack, lane, channel, method, properties, body)):
+                self.executor.submit(self._deliver, callback, auto_ack, lane, channel, method, properties, body)
+
+        return on_message
+
+    def _deliver(self, callback, auto_ack, lane, channel, method, properties, body):
+        try:
+            callback(channel, method, properties, body)
+        except Exception:  # noqa
+            self._reject(method, auto_ack)
+        finally:
+            delivery = lane.leave()
+            if delivery is not None:
+                try:
+                    self.executor.submit(self._deliver, *delivery)
+                except RuntimeError:
+                    pass  # the pool was shut down by `reset_channel`, the broker redelivers parked deliveries.
+
+    def _drain(self):
+        self.executor.shutdown(wait=True)
+        if self.connection.is_open:
+            # run the acks and replies the workers handed back with `add_callback_threadsafe`, so they are flushed.
+            self.connection.process_data_events(time_limit=0)
+        return True
+
+    def reset_channel(self):
+        # let in-flight sends finish against the connection their deliveries came from before reconnecting.
+        self._drain()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gateway")
+        return super().reset_channel()
+
+
+class Lane:
+    """In-flight limit of one gateway.
+
+    Deliveries over the limit are parked in arrival order instead of blocking the connection thread or a worker, and
+    are handed to the pool as the deliveries of the same gateway finish. The broker pushes at most `prefetch_count`
+    unacked deliveries to a manual-ack consumer, which bounds the parked ones; gateways with an in-flight limit must
+    consume with `auto_ack=False`, the broker ignores the prefetch of auto-ack consumers.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.in_flight = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def enter(self, delivery):
+        """
+        Returns:
+            bool: True if the delivery can run now, False if it was parked.
+        """
+        with self._lock:
+            if self.limit and self.in_flight >= self.limit:
+                self._pending.append(delivery)
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        """
+        Returns:
+            tuple: The next parked delivery, which takes over the freed slot, or None.
+        """
+        with self._lock:
+            if self._pending:
+                return self._pending.popleft()
+            self.in_flight -= 1
+            return None
@@ -8,22 +8,103 @@ BUILD_NUMBER = "67a73137"
 KAVEHNEGAR_API_KEY = ""
 KAVEHNEGAR_DEDICATED_NUMBER = ""
 KAVEHNEGAR_OTP_TEMPLATE_NAME = ""
+KAVEHNEGAR_BASE_URL = "https://api.kavenegar.com"
+KAVEHNEGAR_TIMEOUT = 10  # seconds
+KAVEHNEGAR_SENDARRAY_LIMIT = 200  # receptors of one sms_sendarray call
+KAVEHNEGAR_BATCH_SINGLE = False  # send pending single messages together with sms_sendarray, pays off with the threads/asyncio engines
+KAVEHNEGAR_BATCH_WINDOW = 100  # milliseconds a single message waits for others
 
 ########## Twilio API Settings ##########
 TWILIO_ACCOUNT_SID = ""
 TWILIO_AUTH_TOKEN = ""
 TWILIO_DEDICATED_NUMBER = ""
+TWILIO_BASE_URL = "https://api.twilio.com"
+TWILIO_TIMEOUT = 10  # seconds
+TWILIO_GROUP_PARALLELISM = 16  # messages of one group created at once, keep under the account's concurrency limit
+
+########## Circuit Breaker Settings ##########
+CIRCUIT_BREAKER_ENABLED = True  # sms providers are called through a circuit breaker per provider
+CIRCUIT_BREAKER_WINDOW = 50  # last calls of a provider the failure and slow call rates are computed on
+CIRCUIT_BREAKER_MIN_CALLS = 10  # calls in the window before the breaker may open
+CIRCUIT_BREAKER_FAILURE_RATE = 0.5  # share of calls failing with a retryable error that opens the breaker
+CIRCUIT_BREAKER_SLOW_CALL = 5  # seconds, a call taking longer counts as slow
+CIRCUIT_BREAKER_SLOW_RATE = 0.8  # share of slow calls that opens the breaker
+CIRCUIT_BREAKER_OPEN_DURATION = 30  # seconds an open breaker rejects calls before letting trial calls through
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = 3  # trial calls that close the breaker if all of them succeed
+CIRCUIT_BREAKERS = {}  # per provider overrides, exp: {"twilio": {"slow_call": 2, "open_duration": 60}}
+SMS_FAILOVER = {}  # alternate provider of a provider whose breaker is open, exp: {"kavenegar": "twilio"}
+
+########## Rate Limit Settings ##########
+RATE_LIMIT_ENABLED = True  # provider requests wait for a token of their provider/credential bucket
+RATE_LIMITS = {
+    "kavenegar": {"rate": 50, "burst": 50},  # requests per second and burst, per consumer process
+    "twilio": {"rate": 100, "burst": 100},
+    "chabok": {"rate": 50, "burst": 50},
+    "google": {"rate": 500, "burst": 500},  # per push service origin
+}  # a "provider:credential" key overrides the limit of one account, exp: {"twilio:AC123...": {"rate": 10}}
+RATE_LIMIT_MAX_WAIT = 10  # seconds a request may wait for its token before it fails as throttled (429)
+
+########## Idempotency Settings ##########
+IDEMPOTENCY_ENABLED = True  # drop deliveries of messages already sent, recognised by their AMQP message_id or their payload
+IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds a sent message is remembered
+IDEMPOTENCY_CACHE_SIZE = 100_000  # messages remembered per process, the least recently seen are forgotten first
+IDEMPOTENCY_FILE = None  # file the remembered messages are kept in across restarts, exp: "/var/lib/notification/sent.tsv", None keeps them in memory
 
 ########## Chabok API Setting ##########
 CHABOK = {"APP_ID": "", "ACCESS_TOKEN": ""}
+CHABOK_BASE_URL = "https://{app_id}.push.adpdigital.com"
+CHABOK_TIMEOUT = 10  # seconds
+CHABOK_COALESCE = False  # send identical single pushes as one toUsers request, pays off with the threads/asyncio engines
+CHABOK_COALESCE_WINDOW = 50  # milliseconds a single push waits for others with the same content
+CHABOK_COALESCE_MAX_USERS = 100  # users of one coalesced request
+
+########## HTTP Pool Settings ##########
+HTTP_POOL_MAXSIZE = 32  # keep-alive connections kept per provider origin
+HTTP_POOL_BLOCK = False  # wait for a free connection instead of opening a throwaway one when an origin pool is full
+HTTP_POOL_IDLE_TIMEOUT = 30  # seconds, idle connections are closed before providers drop them
+HTTP_POOL_CONNECT_RETRIES = 1
+HTTP_POOL_ORIGINS = {}  # per origin limits, exp: {"https://fcm.googleapis.com": {"maxsize": 128, "block": True}}
 
+########## Jsonify Settings ##########
+JSONIFY_ALLOW_EXTRA_KEYS = True  # accept message keys missing from the templates, exp: the "type" key in "data", False rejects them
+JSON_CODEC = None  # "orjson", "msgspec" or "json", None picks the fastest installed one
+
+########## Fan Out Settings ##########
+FAN_OUT_WORKERS = 64  # threads shared by the per-recipient sends of all groups of a process
+FAN_OUT_PARALLELISM = 16  # per-recipient sends of one group in flight at once
+SMS_GROUP_OTP_PARALLELISM = 16
 
 ########## RabbitMQ Settings ##########
 RABBITMQ_HOST = "localhost"
+RABBITMQ_CONSUMER_ENGINE = "blocking"  # blocking | threads | asyncio
+RABBITMQ_CONSUMER_CONCURRENCY = 32  # deliveries handled at once by the threads and asyncio engines
+
+########## RabbitMQ Queue Settings ##########
+RABBITMQ_SHARED_QUEUES = True  # durable named queues shared by every replica, False declares an exclusive queue per process
+RABBITMQ_QUEUE_NAME = "notification.{exchange}.{routing_key}"  # wildcards are stripped from the routing key
+RABBITMQ_QUEUE_ARGUMENTS = {}  # arguments of every shared queue, exp: {"x-queue-type": "quorum"}
+RABBITMQ_QUEUES = {}  # per binding overrides, exp: {"sms:send.single.otp.*": {"name": "otp", "arguments": {"x-max-length": 10000}}}
+
+########## RabbitMQ QoS Settings ##########
+RABBITMQ_PREFETCH_COUNT = 50  # unacked deliveries the broker pushes to a gateway consumer, 0 is unlimited
+RABBITMQ_MAX_IN_FLIGHT = 0  # deliveries of a gateway handled at once by the threads and asyncio engines, 0 is `--concurrency`
+
+########## RabbitMQ Ack Settings ##########
+RABBITMQ_ACK_BATCH_SIZE = 10  # finished deliveries acked together, 1 acks every delivery on its own, keep it below the prefetch count
+RABBITMQ_ACK_BATCH_WINDOW = 50  # milliseconds the oldest finished delivery waits for its ack
+RABBITMQ_RPC_CONFIRMS = False  # publisher confirms for RPC replies, batched by the broker, asyncio engine only
+
+########## RabbitMQ Retry Settings ##########
+RABBITMQ_RETRY_ENABLED = True  # failed deliveries of shared queues go through retry queues, False rejects them
+RABBITMQ_RETRY_DELAYS = [1, 5, 25, 125]  # seconds, backoff tiers of the retry queues, overridable per binding with "retry_delays" in RABBITMQ_QUEUES
+RABBITMQ_RETRY_QUEUE_NAME = "{queue}.retry.{delay}"
+RABBITMQ_PARKING_QUEUE_NAME = "{queue}.parked"  # permanent failures and deliveries failing after the last tier
+RETRYABLE_STATUSES = {408, 409, 418, 425, 429, 451, 500, 502, 503, 504}  # provider statuses worth retrying, kavenegar 409/418/451 are busy/no credit/throttled
 
 ########## Google API Webpush Settings ##########
-DER_BASE64_ENCODED_PRIVATE_KEY_FILE_PATH = os.path.join(os.getcwd(), "openssl/private.key")
-DER_BASE64_ENCODED_PUBLIC_KEY_FILE_PATH = os.path.join(os.getcwd(), "openssl/public.key")
+WEBPUSH_TIMEOUT = 10  # seconds
+DER_BASE64_ENCODED_PRIVATE_KEY_FILE_PATH = os.environ.get("VAPID_PRIVATE_KEY_FILE", os.path.join(os.getcwd(), "openssl/private.key"))
+DER_BASE64_ENCODED_PUBLIC_KEY_FILE_PATH = os.environ.get("VAPID_PUBLIC_KEY_FILE", os.path.join(os.getcwd(), "openssl/public.key"))
 try:
     VAPID_PRIVATE_KEY = open(DER_BASE64_ENCODED_PRIVATE_KEY_FILE_PATH, "r+").readline().strip("\n")
     VAPID_PUBLIC_KEY = open(DER_BASE64_ENCODED_PUBLIC_KEY_FILE_PATH, "r+").read().strip("\n")
@@ -31,3 +112,34 @@ except FileNotFoundError:
     raise Exception("please provide openssl public/private keys.")
 else:
     VAPID_CLAIMS = {"sub": "mailto:admin@fakemail.com"}
+VAPID_EXPIRATION = 12 * 60 * 60  # seconds a signed VAPID header is valid, at most 24 hours
+VAPID_REFRESH_MARGIN = 10 * 60  # seconds before expiry a cached VAPID header is signed again
+VAPID_CACHE_SIZE = 1024  # push service origins whose VAPID headers are cached
+
+########## Logging Settings ##########
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"  # "json" lines or "text"
+LOG_FILE = None  # path of the log file, None writes to stdout
+LOG_BATCH_SIZE = 256  # records written by the background writer at once
+LOG_QUEUE_SIZE = 10000  # records waiting for the writer, further records are dropped and counted
+LOG_SAMPLE_LEVEL = 20  # per-message records at or below this level (INFO) are sampled
+LOG_SUCCESS_SAMPLE_RATE = 1.0  # share of per-message success records kept, exp: 0.01 keeps 1 in 100
+
+########## Metrics Settings ##########
+METRICS_ENABLED = True  # serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+METRICS_PORT_RANGE = 16  # ports tried from METRICS_PORT on, one per consumer process
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+
+########## Tracing Settings ##########
+TRACING_ENABLED = True  # time the stages of every delivery into the notification_stage_latency_seconds histogram
+TRACING_FILE = None  # path sampled delivery traces are appended to as JSON lines, None exports none
+TRACING_SAMPLE_RATE = 0.01  # share of deliveries traced when TRACING_FILE is set
+
+########## Supervisor Settings ##########
+SUPERVISOR_WORKERS = 1  # consumer processes, `python . --workers N` forks N of them under a supervisor
+SUPERVISOR_RESTART_BACKOFF = 1  # seconds before a crashed consumer is restarted, doubled on every further crash
+SUPERVISOR_RESTART_BACKOFF_MAX = 60
+SUPERVISOR_HEALTHY_UPTIME = 60  # seconds a consumer must stay up before its backoff is reset
+SUPERVISOR_SHUTDOWN_TIMEOUT = 30  # seconds consumers get to exit on SIGTERM before they are killed
@@ -0,0 +1,93 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+from src.core import settings
+from src.core.log import logger
+
+
+class Supervisor:
+    """Run a fixed number of consumer processes and keep them alive.
+
+    Every worker is a forked process with its own RabbitMQ connection, so CPU bound work such as webpush encryption and
+    payload validation is spread over all cores. A worker that dies is restarted after an exponential backoff, and
+    SIGTERM/SIGINT is forwarded to every worker as SIGTERM. The target handles it by stopping the consumer and returning
+    once the deliveries in flight are finished and acked, it gets `SUPERVISOR_SHUTDOWN_TIMEOUT` seconds before it is
+    killed.
+
+    Exp:
+        >>> Supervisor(workers=4, target=consume, args=(options,)).run()
+    """
+
+    def __init__(self, workers, target, args=()):
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self._context = multiprocessing.get_context("fork")
+        self._processes = {}
+        self._started_at = {}
+        self._restart_at = {}
+        self._crashes = {}
+        self._stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for slot in range(self.workers):
+            self._crashes[slot] = 0
+            self._spawn(slot)
+
+        while not self._stopping:
+            self._watch()
+            time.sleep(0.5)
+
+        self._shutdown()
+        return True
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _spawn(self, slot):
+        process = self._context.Process(target=self._work, name=f"consumer-{slot}")
+        process.start()
+        self._processes[slot] = process
+        self._started_at[slot] = time.monotonic()
+        self._restart_at.pop(slot, None)
+        logger.info(f"[*] Consumer {slot} started with pid {process.pid}.")
+
+    def _work(self):
+        # the handlers of the supervisor are inherited by the fork, the target installs its own to stop gracefully.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.target(*self.args)
+        sys.exit(0)
+
+    def _watch(self):
+        now = time.monotonic()
+        for slot, process in self._processes.items():
+            if slot in self._restart_at:
+                if now >= self._restart_at[slot]:
+                    self._spawn(slot)
+            elif not process.is_alive():
+                if now - self._started_at[slot] >= settings.SUPERVISOR_HEALTHY_UPTIME:
+                    self._crashes[slot] = 0
+                delay = min(settings.SUPERVISOR_RESTART_BACKOFF * 2 ** self._crashes[slot], settings.SUPERVISOR_RESTART_BACKOFF_MAX)
+                self._crashes[slot] += 1
+                self._restart_at[slot] = now + delay
+                logger.warning(f"[*] Consumer {slot} exited with code {process.exitcode}, restarting in {delay}s.")
+
+    def _shutdown(self):
+        logger.info("[*] Stopping consumers.")
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + settings.SUPERVISOR_SHUTDOWN_TIMEOUT
+        for process in self._processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        logger.info("[*] Consumers stopped.")
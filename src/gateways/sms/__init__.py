@@ -1,6 +1,7 @@
 import inspect
 import sys
 
+from src.core.log import logger
 from src.core.rabbitmq import RabbitMQ
 from src.gateways.sms.functions import send_group_messages as send_group_messages_func
 from src.gateways.sms.functions import send_group_otp as send_group_otp_func
@@ -9,19 +10,21 @@ from src.gateways.sms.functions import send_single_otp as send_single_otp_func
 
 
 def send_single_message():
-    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.single.*", auto_ack=True, callback=send_single_message_func)
+    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.single.*", auto_ack=False, prefetch_count=50, callback=send_single_message_func)
 
 
 def send_group_messages():
-    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.group.*", auto_ack=True, callback=send_group_messages_func)
+    return RabbitMQ().add_callbacks(
+        exchange_name="sms", routing_key="send.group.*", auto_ack=False, prefetch_count=200, max_in_flight=8, callback=send_group_messages_func
+    )
 
 
 def send_single_otp():
-    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.single.otp.*", auto_ack=False, callback=send_single_otp_func)
+    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.single.otp.*", auto_ack=False, prefetch_count=10, callback=send_single_otp_func)
 
 
 def send_group_otp():
-    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.group.otp.*", auto_ack=False, callback=send_group_otp_func)
+    return RabbitMQ().add_callbacks(exchange_name="sms", routing_key="send.group.otp.*", auto_ack=False, prefetch_count=10, max_in_flight=4, callback=send_group_otp_func)
 
 
 def execute():
@@ -33,5 +36,5 @@ def execute():
     ]
 
     for gateway in gateways:
-        print(f"Gateway '{gateway.__name__}' is registered.")
+        logger.info(f"Gateway '{gateway.__name__}' is registered.")
         gateway()
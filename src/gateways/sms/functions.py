@@ -1,4 +1,6 @@
 from src.core.rabbitmq import RabbitMQ
+from src.core.rabbitmq.retry import PartialFailure
+from src.helpers import codec
 from src.helpers.json_parser import Jsonify
 from src.helpers.messages import get_message
 from src.resources.sms import Send
@@ -22,9 +24,9 @@ def send_single_message(channel, method, properties, body):
 
     """
 
-    response = Jsonify.dict(body.decode(), Jsonify.SMSJType.SINGLE)
+    response = Jsonify.dict(body, Jsonify.SMSJType.SINGLE)
 
-    if Send.single(response=response):
+    if Send.single(response=response, message_id=properties.message_id):
         msg = get_message("send_single_message", **{"receptor": response["data"]["receptor"]})
     else:
         msg = get_message("failed_send_single_message", **{"receptor": response["data"]["receptor"]})
@@ -47,15 +49,22 @@ def send_group_messages(channel, method, properties, body):
 
     Raises:
         ValueError: If the input data does not match the specified template and the phone number or creation time is invalid.
+        PartialFailure: If some receptors were not sent, with the message narrowed down to them for the retry queues.
 
     """
-    response = Jsonify.dict(body.decode(), Jsonify.SMSJType.GROUP)
-
-    if Send.group(response=response):
-        msg = get_message("send_group_message", **{"receptor": ", ".join(response["data"]["receptor"])})
-    else:
-        msg = get_message("failed_send_group_message", **{"receptor": ", ".join(response["data"]["receptor"])})
-
+    response = Jsonify.dict(body, Jsonify.SMSJType.GROUP)
+
+    result = Send.group(response=response, message_id=properties.message_id)
+    if not result:
+        if result.succeeded:
+            msg = get_message("partial_send_group_message", **{"receptor": ", ".join(result.succeeded), "failed": ", ".join(result.unsent)})
+        else:
+            msg = get_message("failed_send_group_message", **{"receptor": ", ".join(response["data"]["receptor"])})
+        # only the unsent receptors go through the retry queues, the sent ones are not sent twice.
+        unsent = {**response, "data": {**response["data"], "receptor": result.unsent}}
+        raise PartialFailure(msg, codec.dumps(unsent), result.errors, result.succeeded)
+
+    msg = get_message("send_group_message", **{"receptor": ", ".join(response["data"]["receptor"])})
     return RabbitMQ().response(ack=method.delivery_tag, msg_to_console=msg)
 
 
@@ -76,9 +85,9 @@ def send_single_otp(channel, method, properties, body):
         ValueError: If the input data does not match the specified template and the phone number or creation time is invalid.
 
     """
-    response = Jsonify.dict(body.decode(), Jsonify.SMSJType.SINGLE_OTP)
+    response = Jsonify.dict(body, Jsonify.SMSJType.SINGLE_OTP)
 
-    if Send.single_otp(response=response):
+    if Send.single_otp(response=response, message_id=properties.message_id):
         msg = get_message("send_single_otp_message", **{"receptor": response["data"]["receptor"]})
     else:
         msg = get_message("failed_send_single_otp_message", **{"receptor": response["data"]["receptor"]})
@@ -87,11 +96,20 @@ def send_single_otp(channel, method, properties, body):
 
 
 def send_group_otp(channel, method, properties, body):
-    response = Jsonify.dict(body.decode(), Jsonify.SMSJType.GROUP_OTP)
-
-    if Send.group_otp(response=response):
-        msg = get_message("send_group_otp_message", **{"receptor": ", ".join(response["data"]["receptor"])})
-    else:
-        msg = get_message("failed_send_group_otp_message", **{"receptor": ", ".join(response["data"]["receptor"])})
-
+    response = Jsonify.dict(body, Jsonify.SMSJType.GROUP_OTP)
+
+    result = Send.group_otp(response=response, message_id=properties.message_id)
+    if not result:
+        if result.succeeded:
+            msg = get_message("partial_send_group_otp_message", **{"receptor": ", ".join(result.succeeded), "failed": ", ".join(result.unsent)})
+        else:
+            msg = get_message("failed_send_group_otp_message", **{"receptor": ", ".join(response["data"]["receptor"])})
+        # only the unsent receptors go through the retry queues, each with its own otp code.
+        errors = result.errors
+        receptors, messages = response["data"]["receptor"], response["data"]["message"]
+        unsent = [(receptor, message) for receptor, message in zip(receptors, messages) if receptor in errors]
+        data = {**response["data"], "receptor": [receptor for receptor, _ in unsent], "message": [message for _, message in unsent]}
+        raise PartialFailure(msg, codec.dumps({**response, "data": data}), errors, result.succeeded)
+
+    msg = get_message("send_group_otp_message", **{"receptor": ", ".join(response["data"]["receptor"])})
     return RabbitMQ().response(ack=method.delivery_tag, msg_to_console=msg)
@@ -1,6 +1,7 @@
 import inspect
 import sys
 
+from src.core.log import logger
 from src.core.rabbitmq import RabbitMQ
 from src.gateways.webpush.functions import get_public_vapid_key as get_public_vapid_key_func
 from src.gateways.webpush.functions import send_google_webpush as send_google_webpush_func
@@ -9,19 +10,24 @@ from src.gateways.webpush.functions import send_single_chabok_webpush as send_si
 
 
 def get_public_vapid_key():
-    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="get.public.vapid.*", auto_ack=True, callback=get_public_vapid_key_func)
+    # a read without side effects, a request lost with a crashed consumer only times out at the RPC caller, which asks again.
+    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="get.public.vapid.*", auto_ack=True, prefetch_count=10, callback=get_public_vapid_key_func)
 
 
 def send_google_webpush():
-    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="send.google.*", auto_ack=True, callback=send_google_webpush_func)
+    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="send.google.*", auto_ack=False, prefetch_count=100, callback=send_google_webpush_func)
 
 
 def send_single_chabok_webpush():
-    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="send.single.chabok.*", auto_ack=True, callback=send_single_chabok_webpush_func)
+    return RabbitMQ().add_callbacks(
+        exchange_name="webpush", routing_key="send.single.chabok.*", auto_ack=False, prefetch_count=100, callback=send_single_chabok_webpush_func
+    )
 
 
 def send_group_chabok_webpush():
-    return RabbitMQ().add_callbacks(exchange_name="webpush", routing_key="send.group.chabok.*", auto_ack=True, callback=send_group_chabok_webpush_func)
+    return RabbitMQ().add_callbacks(
+        exchange_name="webpush", routing_key="send.group.chabok.*", auto_ack=False, prefetch_count=200, max_in_flight=8, callback=send_group_chabok_webpush_func
+    )
 
 
 def execute():
@@ -35,5 +41,5 @@ def execute():
     ]
 
     for gateway in gateways:
-        print(f"Gateway '{gateway.__name__}' is registered.")
+        logger.info(f"Gateway '{gateway.__name__}' is registered.")
         gateway()
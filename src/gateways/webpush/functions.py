@@ -23,7 +23,7 @@ def get_public_vapid_key(channel, method, properties, body):
 
     """
 
-    response = Jsonify.dict(body.decode(), Jsonify.WebPushJType.VAPID_KEY)
+    response = Jsonify.dict(body, Jsonify.WebPushJType.VAPID_KEY)
 
     public_vapid_key = Push.get_public_vapid(response=response)
     if public_vapid_key:
@@ -59,9 +59,9 @@ def send_google_webpush(channel, method, properties, body):
 
     """
 
-    response = Jsonify.dict(body.decode(), Jsonify.WebPushJType.GOOGLE)
+    response = Jsonify.dict(body, Jsonify.WebPushJType.GOOGLE)
 
-    if Push.google(response=response):
+    if Push.google(response=response, message_id=properties.message_id):
         msg = get_message("send_google_webpush", **{"subscription_info": response["subscription_info"]})
     else:
         msg = get_message("failed_send_google_webpush", **{"subscription_info": response["subscription_info"]})
@@ -86,9 +86,9 @@ def send_single_chabok_webpush(channel, method, properties, body):
         ValueError: If the input data does not match the specified template and the user or creation time is invalid.
     """
 
-    response = Jsonify.dict(body.decode(), Jsonify.WebPushJType.SINGLE_CHABOK)
+    response = Jsonify.dict(body, Jsonify.WebPushJType.SINGLE_CHABOK)
 
-    if Push.single_chabok(response=response):
+    if Push.single_chabok(response=response, message_id=properties.message_id):
         msg = get_message("send_single_chabok_webpush", **{"user": response["user"]})
     else:
         msg = get_message("failed_single_chabok_webpush", **{"user": response["user"]})
@@ -113,10 +113,10 @@ def send_group_chabok_webpush(channel, method, properties, body):
         ValueError: If the input data does not match the specified template and the user or creation time is invalid.
     """
 
-    response = Jsonify.dict(body.decode(), Jsonify.WebPushJType.GROUP_CHABOK)
+    response = Jsonify.dict(body, Jsonify.WebPushJType.GROUP_CHABOK)
     users = ", ".join(response["users"])
 
-    if Push.group_chabok(response=response):
+    if Push.group_chabok(response=response, message_id=properties.message_id):
         msg = get_message("send_group_chabok_webpush", **{"users": users})
     else:
         msg = get_message("failed_group_chabok_webpush", **{"users": users})
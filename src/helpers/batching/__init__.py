@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class MicroBatcher:
+    """Coalesce items submitted by concurrent senders into batched provider calls.
+
+    Items are grouped by key; a group is flushed when it holds `max_size` items or when its oldest item has waited
+    `max_wait` milliseconds. `flush(key, items)` sends the whole batch and returns one result per item, where an
+    exception instance marks a failed item; if it raises, every item of the batch fails with that exception. Each
+    `submit` gets its own future, so every source delivery is acked or failed on its own, and an item whose future was
+    cancelled before its batch was sent is left out of it.
+
+    Exp:
+        >>> batcher = MicroBatcher(flush=lambda key, users: [True] * len(users), max_size=100, max_wait=50)
+        >>> batcher.send(("content", "title", "body"), "USER_ID", timeout=1)
+        True
+    """
+
+    def __init__(self, flush, max_size, max_wait, workers=4, name="batcher"):
+        self._flush = flush
+        self.max_size = max_size
+        self.max_wait = max_wait / 1000
+        self.workers = workers
+        self.name = name
+        self._batches = {}
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def _start(self):
+        # started lazily and again after a fork, threads do not survive into supervised consumers.
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def submit(self, key, item):
+        """
+        Add an item to the pending batch of its key.
+
+        Args:
+            key (hashable): Items with equal keys are sent together.
+            item: The item handed to `flush`.
+
+        Returns:
+            Future: Resolves to the result of the item once its batch is sent.
+        """
+        future = Future()
+        with self._condition:
+            if self._pid != os.getpid():
+                self._batches = {}
+                self._start()
+            deadline, items, futures = self._batches.setdefault(key, (time.monotonic() + self.max_wait, [], []))
+            items.append(item)
+            futures.append(future)
+            if len(items) >= self.max_size:
+                self._executor.submit(self._send, key, *self._batches.pop(key)[1:])
+            else:
+                self._condition.notify()
+        return future
+
+    def send(self, key, item, timeout):
+        """
+        Add an item to the pending batch of its key and wait for its result.
+
+        Args:
+            key (hashable): Items with equal keys are sent together.
+            item: The item handed to `flush`.
+            timeout (float): Seconds to wait for the batch, exp: the batch window plus the provider timeout.
+
+        Returns:
+            The result of the item.
+
+        Raises:
+            TimeoutError: If the batch was not sent in time, exp: the flusher hangs; the item is withdrawn from its batch
+                before it is raised, so the caller retries a delivery that was never sent.
+        """
+        future = self.submit(key, item)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise TimeoutError(f"{self.name}: no result within {timeout:.1f}s, withdrawn from its batch")
+            # its batch is being sent already, only the result tells whether the item was sent.
+            return future.result()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                expired = [key for key, (deadline, _, _) in self._batches.items() if deadline <= now]
+                for key in expired:
+                    self._executor.submit(self._send, key, *self._batches.pop(key)[1:])
+                deadlines = [deadline for deadline, _, _ in self._batches.values()]
+                self._condition.wait(timeout=min(deadlines) - now if deadlines else None)
+
+    def _send(self, key, items, futures):
+        # items whose sender gave up waiting are dropped, the others can no longer be withdrawn.
+        pending = [(item, future) for item, future in zip(items, futures) if future.set_running_or_notify_cancel()]
+        if not pending:
+            return
+        items, futures = [item for item, _ in pending], [future for _, future in pending]
+        try:
+            results = self._flush(key, items)
+        except Exception as e:  # noqa
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+
+from src.core import settings
+from src.core.metrics import Gauge
+from src.core.rabbitmq.retry import PERMANENT
+from src.core.rabbitmq.retry import classify
+from src.helpers.fan_out import GroupResult
+from src.helpers.rate_limit import RateLimitExceeded
+
+CIRCUIT_STATE = Gauge("notification_circuit_breaker_state", "State of the circuit breaker of a provider, 0 closed, 1 open, 2 half-open.", ("provider",))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open, nothing was sent."""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider}: circuit breaker is open, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Process wide circuit breaker of a provider.
+
+    The outcome of the last `window` calls and the latency of the last `window` provider requests are kept; once
+    `min_calls` of them are known, the breaker opens if at least `failure_rate` of the calls failed or at least
+    `slow_rate` of the requests took longer than `slow_call` seconds. An open breaker rejects calls with
+    `CircuitOpenError` for `open_duration` seconds, then lets `half_open_calls` trial calls through: the breaker closes
+    if all of them succeed and opens again on the first failure.
+
+    Only retryable errors (timeouts, 429, 5xx, see `src.core.rabbitmq.retry.classify`) are failures; a provider
+    refusing an invalid receptor is healthy, and running out of local rate limit tokens is no failure of the provider.
+    Requests report their own latency through `observe` once their rate limit token is acquired, so waiting for the
+    local rate limit never counts as latency, whichever thread (a fan-out worker, a micro-batch flusher) sends them.
+
+    Exp:
+        >>> breaker = CircuitBreaker("kavenegar")
+        >>> breaker.call(kavenegar_service.send_single_message, "+989101111111", "salam")
+        True
+    """
+
+    def __init__(self, provider, **options):
+        options = {**settings.CIRCUIT_BREAKERS.get(provider, {}), **options}
+        self.provider = provider
+        self.window = options.get("window", settings.CIRCUIT_BREAKER_WINDOW)
+        self.min_calls = options.get("min_calls", settings.CIRCUIT_BREAKER_MIN_CALLS)
+        self.failure_rate = options.get("failure_rate", settings.CIRCUIT_BREAKER_FAILURE_RATE)
+        self.slow_call = options.get("slow_call", settings.CIRCUIT_BREAKER_SLOW_CALL)
+        self.slow_rate = options.get("slow_rate", settings.CIRCUIT_BREAKER_SLOW_RATE)
+        self.open_duration = options.get("open_duration", settings.CIRCUIT_BREAKER_OPEN_DURATION)
+        self.half_open_calls = options.get("half_open_calls", settings.CIRCUIT_BREAKER_HALF_OPEN_CALLS)
+        self._calls = deque(maxlen=self.window)
+        self._requests = deque(maxlen=self.window)
+        self._lock = threading.Lock()
+        self._opened_at = None
+        self._trials = 0
+        self._trial_successes = 0
+        self._set_state(CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(self.provider, value=STATE_VALUES[state])
+
+    def _acquire(self):
+        with self._lock:
+            if self.state == OPEN:
+                retry_after = self._opened_at + self.open_duration - time.monotonic()
+                if retry_after > 0:
+                    raise CircuitOpenError(self.provider, retry_after)
+                self._set_state(HALF_OPEN)
+                self._trials = 0
+                self._trial_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    raise CircuitOpenError(self.provider, 0)
+                self._trials += 1
+
+    def _record(self, failed):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._calls.clear()
+                        self._requests.clear()
+                        self._set_state(CLOSED)
+                return
+
+            if self.state == OPEN:
+                return  # a call started before the breaker opened
+
+            self._calls.append(failed)
+            if len(self._calls) >= self.min_calls and sum(self._calls) >= self.failure_rate * len(self._calls):
+                self._open()
+
+    def observe(self, duration):
+        """
+        Record the latency of a provider request, measured after its rate limit token was acquired.
+
+        Args:
+            duration (float): The seconds the provider took to answer.
+        """
+        with self._lock:
+            if self.state != CLOSED:
+                return  # trial calls are judged by their outcome only
+
+            self._requests.append(duration >= self.slow_call)
+            if len(self._requests) >= self.min_calls and sum(self._requests) >= self.slow_rate * len(self._requests):
+                self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call a provider through the breaker.
+
+        Args:
+            func (callable): The provider call.
+
+        Returns:
+            The result of `func`. A `GroupResult` is a failed call if any of its unsent recipients failed with a
+            retryable error, the group send itself does not raise.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, `func` is not called.
+        """
+        self._acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record(self._is_failure(e))
+            raise
+        self._record(isinstance(result, GroupResult) and any(self._is_failure(error) for error in result.errors.values()))
+        return result
+
+    @staticmethod
+    def _is_failure(error):
+        cause = error
+        while cause is not None:
+            if isinstance(cause, RateLimitExceeded):
+                return False
+            cause = cause.__cause__ or cause.__context__
+        return classify(error) != PERMANENT
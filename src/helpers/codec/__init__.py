@@ -0,0 +1,74 @@
+import json
+
+from src.core import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _json_codec():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    return "json", json.loads, lambda obj: encoder.encode(obj).encode("utf-8"), (ValueError,)
+
+
+def _orjson_codec():
+    return "orjson", orjson.loads, orjson.dumps, (orjson.JSONDecodeError,)
+
+
+def _msgspec_codec():
+    return "msgspec", msgspec.json.decode, msgspec.json.encode, (msgspec.DecodeError,)
+
+
+CODECS = {"json": _json_codec, "orjson": _orjson_codec, "msgspec": _msgspec_codec}
+
+
+def _select(name=None):
+    if name:
+        return CODECS[name]()
+    if orjson is not None:
+        return _orjson_codec()
+    if msgspec is not None:
+        return _msgspec_codec()
+    return _json_codec()
+
+
+NAME, _loads, _dumps, _DECODE_ERRORS = _select(settings.JSON_CODEC)
+
+
+def loads(data):
+    """
+    Parses a JSON document with the fastest installed codec (orjson, msgspec, then stdlib json).
+
+    Args:
+        data (bytes | str): The JSON document, exp: the raw body of an AMQP message, parsed without a `.decode()` copy.
+
+    Returns:
+        The parsed document.
+
+    Raises:
+        ValueError: If the data is not valid JSON.
+    """
+    try:
+        return _loads(data)
+    except _DECODE_ERRORS as e:
+        raise ValueError(f"Invalid json: {e}")
+
+
+def dumps(obj):
+    """
+    Serialises an object to compact UTF-8 JSON with the codec used by `loads`.
+
+    Args:
+        obj: A JSON-serialisable object.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    return _dumps(obj)
@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from src.core import settings
+
+
+class GroupResult:
+    """Per-recipient outcome of a group send.
+
+    A group is sent as a whole only if every recipient succeeded; otherwise it holds which recipients failed (with their
+    errors) and which were throttled by the provider, so the caller can report or retry exactly those.
+
+    Exp:
+        >>> result = FanOut().run(lambda phone_number, text: ..., [("+989101111111", "7589"), ("+12025550123", "1234")])
+        >>> bool(result), result.succeeded, result.failed
+        (False, ['+989101111111'], {'+12025550123': Exception('Twilio: Error sending OTP message: ...')})
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = {}
+        self.throttled = {}
+
+    def add(self, recipient, error=None):
+        if error is None:
+            self.succeeded.append(recipient)
+        elif is_throttled(error):
+            self.throttled[recipient] = error
+        else:
+            self.failed[recipient] = error
+
+    @property
+    def unsent(self):
+        return [*self.failed, *self.throttled]
+
+    @property
+    def errors(self):
+        return {**self.failed, **self.throttled}
+
+    def __bool__(self):
+        return not self.failed and not self.throttled
+
+    def __repr__(self):
+        return f"GroupResult(succeeded={len(self.succeeded)}, failed={len(self.failed)}, throttled={len(self.throttled)})"
+
+
+def is_throttled(error):
+    """
+    Check whether an error, or one it was raised from, is a provider rate limit response (HTTP 429).
+
+    Args:
+        error (Exception): The error raised by a provider service.
+
+    Returns:
+        bool: True if the provider throttled the request.
+    """
+    while error is not None:
+        if getattr(error, "status", None) == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class FanOut:
+    """Process wide pool fanning the per-recipient sends of a group out concurrently.
+
+    Each group keeps at most `parallelism` of its sends in flight, so one large group cannot take every worker of the
+    `settings.FAN_OUT_WORKERS` shared by all groups of the process, and a failing recipient does not stop the others.
+
+    Exp:
+        >>> FanOut().run(lambda phone_number, text: proxy.send_otp_message(phone_number, text), zip(phone_numbers, texts), parallelism=16)
+        GroupResult(succeeded=500, failed=0, throttled=0)
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    instance = super(FanOut, cls).__new__(cls)
+                    instance._executor = ThreadPoolExecutor(max_workers=settings.FAN_OUT_WORKERS, thread_name_prefix="fan-out")
+                    cls.instance = instance
+        return cls.instance
+
+    def run(self, send, items, parallelism=None):
+        """
+        Send to every recipient of a group and wait for all of them.
+
+        Args:
+            send (callable): Called as `send(recipient, *args)` for every item, raises if the send failed.
+            items (iterable): (recipient, *args) tuples.
+            parallelism (int): Sends of this group in flight at once, defaults to `settings.FAN_OUT_PARALLELISM`.
+
+        Returns:
+            GroupResult: The outcome of every recipient.
+        """
+        parallelism = parallelism or settings.FAN_OUT_PARALLELISM
+        result = GroupResult()
+        pending = {}
+
+        for item in items:
+            pending[self._executor.submit(send, *item)] = item[0]
+            while len(pending) >= parallelism:
+                self._collect(pending, result)
+        while pending:
+            self._collect(pending, result)
+        return result
+
+    @staticmethod
+    def _collect(pending, result):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result.add(pending.pop(future), future.exception())
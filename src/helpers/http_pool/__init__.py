@@ -0,0 +1,97 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from src.core import settings
+from urllib3.util.retry import Retry
+
+
+class HTTPSessionPool:
+    """Process wide keep-alive `requests` sessions, one per origin.
+
+    Every provider origin (exp: "https://api.kavenegar.com", "https://fcm.googleapis.com") gets its own session with a
+    pool of `settings.HTTP_POOL_MAXSIZE` keep-alive connections, overridable per origin in `settings.HTTP_POOL_ORIGINS`,
+    so consecutive sends reuse TCP/TLS connections instead of handshaking on every message. Connections of an origin idle
+    for longer than `settings.HTTP_POOL_IDLE_TIMEOUT` are closed before the provider drops them, connections dropped
+    anyway are discarded by urllib3 when they are checked out and a failing connect is retried
+    `settings.HTTP_POOL_CONNECT_RETRIES` times.
+
+    Exp:
+        >>> HTTPSessionPool().session("https://api.kavenegar.com/v1/...").post(...)
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    # checked again under the lock, threads racing on the first call build one instance and only see it fully built.
+                    instance = super(HTTPSessionPool, cls).__new__(cls)
+                    instance._sessions = {}
+                    instance._last_used = {}
+                    instance._last_eviction = time.monotonic()
+                    instance._lock = threading.Lock()
+                    cls.instance = instance
+        return cls.instance
+
+    @staticmethod
+    def origin(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def session(self, url):
+        """
+        Get the pooled session of the origin of `url`.
+
+        Args:
+            url (str): Any url of the origin.
+
+        Returns:
+            requests.Session: The keep-alive session of the origin.
+        """
+        origin = self.origin(url)
+        with self._lock:
+            if origin not in self._sessions:
+                self._sessions[origin] = self._create(origin)
+            self._last_used[origin] = time.monotonic()
+            return self._sessions[origin]
+
+    def _create(self, origin):
+        options = settings.HTTP_POOL_ORIGINS.get(origin, {})
+        retries = Retry(total=settings.HTTP_POOL_CONNECT_RETRIES, connect=settings.HTTP_POOL_CONNECT_RETRIES, read=0, status=0, redirect=0, allowed_methods=None)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=options.get("maxsize", settings.HTTP_POOL_MAXSIZE),
+            pool_block=options.get("block", settings.HTTP_POOL_BLOCK),
+            max_retries=retries,
+        )
+
+        session = requests.Session()
+        session.mount(origin, adapter)
+        session.hooks["response"].append(lambda response, *args, **kwargs: self._touch(origin))
+        return session
+
+    def _touch(self, origin):
+        now = time.monotonic()
+        with self._lock:
+            self._last_used[origin] = now
+        if now - self._last_eviction >= settings.HTTP_POOL_IDLE_TIMEOUT:
+            self.evict_idle()
+
+    def evict_idle(self):
+        """
+        Close the connections of origins idle for longer than `settings.HTTP_POOL_IDLE_TIMEOUT`.
+
+        The sessions stay registered and open new connections on their next request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._last_eviction = now
+            idle = [origin for origin, last_used in self._last_used.items() if now - last_used >= settings.HTTP_POOL_IDLE_TIMEOUT]
+            for origin in idle:
+                self._sessions[origin].close()
+                del self._last_used[origin]
+        return idle
@@ -0,0 +1,230 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.core import settings
+from src.core.log import logger
+from src.core.metrics import Counter
+
+DUPLICATES = Counter("notification_duplicate_deliveries_total", "Deliveries skipped because the same message was already sent.", ("operation",))
+
+
+def idempotency_key(operation, response, message_id=None):
+    """
+    Build the key a message is remembered by.
+
+    Args:
+        operation (str): The send operation, exp: "Send.single", so equal payloads of different gateways do not collide.
+        response (dict): The validated message, its application, receptors/users, content and `created_time`.
+        message_id (str, optional): The AMQP `message_id` set by the producer, used instead of the payload.
+
+    Returns:
+        str: The key.
+
+    Exp:
+        >>> idempotency_key("Send.single", {"application": "app", "created_time": "2023-02-28 15:30:00", "data": {...}})
+        'Send.single:5e0f1c...'
+    """
+    if message_id:
+        return f"{operation}:id:{message_id}"
+    payload = json.dumps(response, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{operation}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class IdempotencyCache:
+    """Process wide record of the messages already sent, to drop duplicate deliveries.
+
+    A message is claimed while it is being sent and remembered for `settings.IDEMPOTENCY_TTL` seconds once it was sent;
+    if the send raises or fails, the claim is released without remembering it so the retried delivery is sent. At most
+    `settings.IDEMPOTENCY_CACHE_SIZE` messages are remembered, the least recently seen are forgotten first.
+
+    With `settings.IDEMPOTENCY_FILE` every remembered message is also appended to that file, which is loaded when a
+    process first uses the cache and rewritten without expired entries once a process appended twice the cache size to
+    it, so duplicates redelivered after a restart are dropped as well. The consumer processes of a supervisor share the
+    file: appends and rewrites hold an exclusive `flock` on "<file>.lock", and a rewrite keeps the lines the other
+    processes appended. Processes only see each other's messages that were in the file when they started; the cache
+    narrows duplicates down, it does not rule them out.
+
+    Exp:
+        >>> cache = IdempotencyCache()
+        >>> with cache.claim("Send.single:id:42") as fresh:
+        ...     if fresh and Send.single(response=response):
+        ...         cache.remember("Send.single:id:42")
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    instance = super(IdempotencyCache, cls).__new__(cls)
+                    instance._entries = OrderedDict()
+                    instance._claimed = set()
+                    instance._lock = threading.Lock()
+                    instance._pid = None
+                    instance._file = None
+                    instance._appended = 0
+                    cls.instance = instance
+        return cls.instance
+
+    def _load(self):
+        # loaded lazily and again after a fork, the supervisor forks consumers that each need their own file handles.
+        self._pid = os.getpid()
+        self._entries = OrderedDict()
+        self._claimed = set()
+        self._file = None
+        self._lock_file = None
+        if not settings.IDEMPOTENCY_FILE:
+            return
+
+        now = time.time()
+        try:
+            self._lock_file = open(f"{settings.IDEMPOTENCY_FILE}.lock", "a", encoding="utf-8")
+            with self._locked():
+                self._entries = self._read(now)
+                self._evict(now)
+                self._compact(now)
+        except OSError:
+            logger.exception("Idempotency file %s could not be written, sent messages are only kept in memory.", settings.IDEMPOTENCY_FILE)
+            self._file = None
+
+    @contextmanager
+    def _locked(self):
+        # a lock on a file of its own, the idempotency file is replaced by every rewrite.
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _read(self, now):
+        """
+        Returns:
+            OrderedDict: The unexpired messages of the idempotency file, the most recently appended last.
+        """
+        entries = OrderedDict()
+        try:
+            with open(settings.IDEMPOTENCY_FILE, "r", encoding="utf-8") as file:
+                for line in file:
+                    key, _, expires = line.rstrip("\n").rpartition("\t")
+                    if key and float(expires or 0) > now:
+                        entries[key] = float(expires)
+                        entries.move_to_end(key)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.exception("Idempotency file %s could not be loaded.", settings.IDEMPOTENCY_FILE)
+        return entries
+
+    def _evict(self, now):
+        while self._entries and (len(self._entries) > settings.IDEMPOTENCY_CACHE_SIZE or next(iter(self._entries.values())) <= now):
+            self._entries.popitem(last=False)
+
+    def _compact(self, now):
+        # called with the lock held, the file is re-read so the lines of the other processes are kept.
+        entries = self._read(now)
+        while len(entries) > settings.IDEMPOTENCY_CACHE_SIZE:
+            entries.popitem(last=False)
+        if self._file is not None:
+            self._file.close()
+        path = settings.IDEMPOTENCY_FILE
+        with open(f"{path}.{self._pid}.tmp", "w", encoding="utf-8") as file:
+            file.writelines(f"{key}\t{expires}\n" for key, expires in entries.items())
+        os.replace(f"{path}.{self._pid}.tmp", path)
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._appended = 0
+
+    def _append(self, key, expires, now):
+        with self._locked():
+            if os.fstat(self._file.fileno()).st_ino != os.stat(settings.IDEMPOTENCY_FILE).st_ino:
+                # rewritten by another process, appends to the old file would be lost.
+                self._file.close()
+                self._file = open(settings.IDEMPOTENCY_FILE, "a", encoding="utf-8", buffering=1)
+            self._file.write(f"{key}\t{expires}\n")
+            self._appended += 1
+            if self._appended > 2 * settings.IDEMPOTENCY_CACHE_SIZE:
+                self._compact(now)
+
+    def remember(self, key):
+        """Remember a sent message for `settings.IDEMPOTENCY_TTL` seconds."""
+        now = time.time()
+        expires = now + settings.IDEMPOTENCY_TTL
+        with self._lock:
+            if self._pid != os.getpid():
+                self._load()
+            self._entries[key] = expires
+            self._entries.move_to_end(key)
+            self._evict(now)
+            if self._file is not None:
+                try:
+                    self._append(key, expires, now)
+                except OSError:
+                    # the message was sent, failing its delivery now would send it again.
+                    logger.exception("Idempotency file %s could not be written, sent messages are only kept in memory.", settings.IDEMPOTENCY_FILE)
+                    self._file = None
+
+    @contextmanager
+    def claim(self, key):
+        """
+        Claim a message for sending, the claim is released when the block exits.
+
+        The caller remembers the message with `remember` once it was sent, a failed send is not remembered so the
+        retried delivery is sent again.
+
+        Yields:
+            bool: True if the caller should send the message, False if it is a duplicate.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._load()
+            duplicate = key in self._claimed or self._entries.get(key, 0) > time.time()
+            if not duplicate:
+                self._claimed.add(key)
+
+        if duplicate:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._claimed.discard(key)
+
+
+def idempotent(func):
+    """
+    Skip a `Send`/`Push` operation for a message it already sent.
+
+    The decorated classmethod takes the producer's AMQP `message_id` as an optional `message_id` keyword; without it the
+    message is recognised by its payload. A duplicate is not sent and reported as sent, so the gateway acks it. Only
+    messages the operation reports as sent are remembered, a falsy result (exp: a `GroupResult` with failed recipients)
+    lets the retried or re-published delivery through.
+    """
+    operation = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(cls, response, *args, message_id=None, **kwargs):
+        if not settings.IDEMPOTENCY_ENABLED:
+            return func(cls, response, *args, **kwargs)
+
+        key = idempotency_key(operation, response, message_id)
+        with IdempotencyCache().claim(key) as fresh:
+            if not fresh:
+                DUPLICATES.inc(operation)
+                logger.info("Duplicate of %s skipped (%s).", operation, key, extra={"sample": True})
+                return True
+            result = func(cls, response, *args, **kwargs)
+            if result:
+                # remembered before the claim is released, a duplicate arriving meanwhile still finds the claim.
+                IdempotencyCache().remember(key)
+            return result
+
+    return wrapper
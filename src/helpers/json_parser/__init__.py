@@ -1,6 +1,20 @@
 import json
 from enum import Enum
 
+from src.core import settings
+from src.core.tracing import span
+from src.helpers import codec
+
+
+class InvalidMessage(ValueError):
+    """Raised when a message does not match its template or fails validation, it is counted as an invalid delivery."""
+
+    outcome = "invalid"
+
+
+class InvalidJson(InvalidMessage, TypeError):
+    """Raised when a message body is not JSON, still a TypeError as `Jsonify` raised before."""
+
 
 class Jsonify:
     """
@@ -71,8 +85,7 @@ class Jsonify:
             str: A string representing the input data in JSON format.
         """
         if JsonParser.is_dict(data, exception=True):
-            if not JsonParser.check_attribute(data=data, template=template):
-                raise ValueError("Input data does not match the specified template")
+            JsonParser.validate(data=data, template=template)
         return json.dumps(data)
 
     @staticmethod
@@ -80,21 +93,28 @@ class Jsonify:
         """
         Converts a JSON-formatted string to a Python dictionary, validating the data against the specified template.
 
+        The data is parsed once, straight from the raw message body when it is given as bytes.
+
         Args:
-            data (str): A string representing the data in JSON format.
+            data (bytes | str): The data in JSON format.
             template (Enum): An enumeration specifying the expected data types and structure of the JSON data.
 
         Raises:
+            TypeError: If the input data is not json.
             ValueError: If the input data does not match the specified template.
 
         Returns:
             dict: A python dictionary containing the input data.
         """
-        if JsonParser.is_json(data, exception=True):
-            data = json.loads(data)
-            if not JsonParser.check_attribute(data=data, template=template):
-                raise ValueError("Input data does not match the specified template")
-        return dict(data)
+        with span("decode"):
+            try:
+                data = codec.loads(data)
+            except ValueError:
+                raise InvalidJson("Input data must be a json str")
+        with span("jsonify"):
+            JsonParser.is_dict(data, exception=True)
+            JsonParser.validate(data=data, template=template)
+        return data
 
 
 class JsonParser:
@@ -120,7 +140,7 @@ class JsonParser:
         if isinstance(data, dict):
             return True
         elif exception:
-            raise ValueError("Input data is not a dictionary")
+            raise InvalidMessage("Input data is not a dictionary")
         else:
             return False
 
@@ -130,7 +150,7 @@ class JsonParser:
         Checks if the input data is a valid JSON-formatted string.
 
         Args:
-            data (str): The string to check.
+            data (bytes | str): The string to check.
             exception (bool, optional): Whether to raise a TypeError if the data is not a valid JSON string. Defaults to False.
 
         Returns:
@@ -140,13 +160,28 @@ class JsonParser:
             ValueError: If the input data is not json str.
         """
         try:
-            json.loads(data)
+            codec.loads(data)
         except ValueError:
             if exception:
-                raise TypeError("Input data must be a json str")
+                raise InvalidJson("Input data must be a json str")
             return False
         return True
 
+    @staticmethod
+    def validate(data, template: Enum):
+        """
+        Validates the data against the precompiled validator of the specified template.
+
+        Args:
+            data (dict): The data to check.
+            template (Enum): The template specifying the expected data types and structure of the data.
+
+        Raises:
+            ValueError: If the data does not match the template, naming the offending key, exp:
+                "Input data does not match the specified template: 'data.receptor' must be list, got str"
+        """
+        VALIDATORS[template](data)
+
     @staticmethod
     def check_attribute(data, template: Enum):
         """
@@ -158,27 +193,64 @@ class JsonParser:
 
         Returns:
             bool: True if the data matches the template, False otherwise.
-
-        Raises:
-            TypeError: If the template is not match.
-        """
-        # trim data
-        trimmed_data = {}
-        for data_key, data_value in data.items():
-            if not isinstance(data[data_key], dict):
-                trimmed_data[data_key] = data_value
-            else:
-                # when data_key is dictionary
-                trimmed_data[data_key] = {}
-                for key, value in data[data_key].items():
-                    trimmed_data[f"{data_key}.{key}"] = value
-
-        # template matching
+        """
         try:
-            for trimmed_data_key, template_key in zip(trimmed_data.keys(), template.value.keys()):
-                if not ((trimmed_data_key == template_key) and isinstance(trimmed_data[trimmed_data_key], template.value[template_key])):
-                    raise TypeError("Template not match.")
-        except TypeError:
+            VALIDATORS[template](data)
+        except ValueError:
             return False
         else:
             return True
+
+
+def compile_template(template: Enum, allow_extra_keys=True):
+    """
+    Compiles a template into a validator function.
+
+    The dotted keys of the template (exp: "data.receptor") are turned into nested checks once, so validating a message
+    only looks its keys up, independent of their order, without building intermediate dictionaries.
+
+    Args:
+        template (Enum): The template specifying the expected data types and structure of the data.
+        allow_extra_keys (bool, optional): Whether keys missing from the template are accepted. Defaults to True.
+
+    Returns:
+        callable: `validator(data)`, raising a ValueError with the path of the first mismatch.
+    """
+    tree = {}
+    for path, kind in template.value.items():
+        *parents, key = path.split(".")
+        node = tree
+        for parent in parents:
+            node = node[parent][1]
+        node[key] = (kind, {})
+    return _compile_node(tree, "", allow_extra_keys)
+
+
+def _compile_node(node, prefix, allow_extra_keys):
+    checks = tuple(
+        (key, f"{prefix}{key}", kind, _compile_node(children, f"{prefix}{key}.", allow_extra_keys) if children else None) for key, (kind, children) in node.items()
+    )
+    keys = frozenset(node)
+
+    def validator(data):
+        for key, path, kind, nested in checks:
+            try:
+                value = data[key]
+            except KeyError:
+                raise InvalidMessage(f"Input data does not match the specified template: '{path}' is required")
+            if not isinstance(value, kind):
+                raise InvalidMessage(f"Input data does not match the specified template: '{path}' must be {kind.__name__}, got {type(value).__name__}")
+            if nested is not None:
+                nested(value)
+        if not allow_extra_keys and len(data) != len(checks):
+            extra = sorted(data.keys() - keys)
+            raise InvalidMessage(f"Input data does not match the specified template: '{prefix}{extra[0]}' is not allowed")
+
+    return validator
+
+
+VALIDATORS = {
+    template: compile_template(template, allow_extra_keys=settings.JSONIFY_ALLOW_EXTRA_KEYS)
+    for templates in (Jsonify.SMSJType, Jsonify.WebPushJType)
+    for template in templates
+}
@@ -1,7 +1,8 @@
-import copy
-
 from .message_source import messages_dict
 
+# one bound `str.format` per message and mode, so building a message neither copies `messages_dict` nor parses it.
+FORMATTERS = {key: {mode: template.format for mode, template in msg.items()} if isinstance(msg, dict) else msg.format for key, msg in messages_dict.items()}
+
 
 def get_message(key, **kwargs):
     """Get message.
@@ -16,14 +17,19 @@ def get_message(key, **kwargs):
     Raises:
         There is no raised exception.
     """
-    msg = copy.deepcopy(messages_dict).get(key, "===== msg error =====")
-    if isinstance(msg, dict):
+    formatter = FORMATTERS.get(key)
+    if formatter is None:
+        return "===== msg error ====="
+    if isinstance(formatter, dict):
         if "a_sync" in kwargs.keys():
-            if kwargs["a_sync"]:
-                msg = msg.pop("a_sync", "----- msg error -----")
+            if kwargs.pop("a_sync"):
+                formatter = formatter.get("a_sync")
+                if formatter is None:
+                    return "----- msg error -----"
             else:
-                msg = msg.pop("sync", "+++++ msg error +++++")
-            kwargs.pop("a_sync")
+                formatter = formatter.get("sync")
         else:
-            msg = msg.pop("sync", "+++++ msg error +++++")
-    return msg.format(**kwargs)
+            formatter = formatter.get("sync")
+        if formatter is None:
+            return "+++++ msg error +++++"
+    return formatter(**kwargs)
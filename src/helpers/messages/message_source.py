@@ -15,6 +15,9 @@ messages_dict = {
     "failed_send_group_message": {
         "sync": "messages to '{receptor}' sent failed",
     },
+    "partial_send_group_message": {
+        "sync": "messages to '{receptor}' sent successfully, to '{failed}' sent failed",
+    },
     "send_single_otp_message": {
         "sync": "single otp message to '{receptor}' sent successfully",
     },
@@ -27,6 +30,9 @@ messages_dict = {
     "failed_send_group_otp_message": {
         "sync": "group otp messages to '{receptor}' sent failed",
     },
+    "partial_send_group_otp_message": {
+        "sync": "group otp messages to '{receptor}' sent successfully, to '{failed}' sent failed",
+    },
     ############################## send_webpush module ##############################
     "send_google_webpush": {
         "sync": "push notification to subscription '{subscription_info}' sent successfully by Google",
@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from src.core import settings
+from src.core.metrics import PROVIDER_LATENCY
+from src.core.metrics import Histogram
+
+RATE_LIMIT_WAIT = Histogram("notification_rate_limit_wait_seconds", "Time provider requests waited for a token of their rate limit.", ("provider",))
+
+
+class RateLimitExceeded(Exception):
+    """Raised instead of sending when the wait for a token would exceed `settings.RATE_LIMIT_MAX_WAIT`.
+
+    It carries status 429 like a provider throttling response, so single sends go to the retry queues and group sends
+    report the recipient as throttled, their gateway republishes the unsent recipients to the retry queues.
+    """
+
+    status = 429
+
+    def __init__(self, provider, wait):
+        super().__init__(f"{provider}: rate limit exceeded, no token within {wait}s")
+        self.provider = provider
+        self.wait = wait
+
+
+class TokenBucket:
+    """Token bucket refilled with `rate` tokens per second up to `burst` tokens.
+
+    A request reserves its token up front, even if the bucket is empty, and sleeps until the token is due, so
+    concurrent senders are spread evenly over time in the order they asked instead of retrying in a burst.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1, max_wait=None):
+        """
+        Reserve tokens.
+
+        Args:
+            tokens (int): The tokens the request takes.
+            max_wait (float, optional): Seconds the request may wait, nothing is reserved if the tokens are due later.
+
+        Returns:
+            float: Seconds until the tokens are due, or None if that is more than `max_wait`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= tokens
+            return wait
+
+
+class RateLimiter:
+    """Process wide token buckets, one per provider and credential.
+
+    Limits come from `settings.RATE_LIMITS`, keyed by "provider:credential" or by provider; every concurrent sender of
+    the process draws from the same bucket. Each consumer process has its own buckets, so with `--workers N` the
+    account sees up to N times the configured rate.
+
+    Exp:
+        >>> RateLimiter().acquire("kavenegar", settings.KAVEHNEGAR_API_KEY)
+        0.0
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    instance = super(RateLimiter, cls).__new__(cls)
+                    instance._buckets = {}
+                    instance._lock = threading.Lock()
+                    cls.instance = instance
+        return cls.instance
+
+    def bucket(self, provider, credential=""):
+        """
+        Returns:
+            TokenBucket: The bucket of the provider credential, or None if the provider is not limited.
+        """
+        key = (provider, credential)
+        with self._lock:
+            if key not in self._buckets:
+                limit = settings.RATE_LIMITS.get(f"{provider}:{credential}", settings.RATE_LIMITS.get(provider))
+                self._buckets[key] = TokenBucket(limit["rate"], limit.get("burst")) if limit else None
+            return self._buckets[key]
+
+    def acquire(self, provider, credential="", tokens=1):
+        """
+        Wait for the tokens of a provider request.
+
+        Args:
+            provider (str): The provider, exp: "kavenegar", "twilio", "chabok", "google".
+            credential (str): The account the quota applies to, exp: the api key or the push service origin.
+            tokens (int): The tokens the request takes.
+
+        Returns:
+            float: The seconds the request waited.
+
+        Raises:
+            RateLimitExceeded: If the wait would exceed `settings.RATE_LIMIT_MAX_WAIT`.
+        """
+        bucket = self.bucket(provider, credential) if settings.RATE_LIMIT_ENABLED else None
+        if bucket is None:
+            return 0.0
+
+        wait = bucket.reserve(tokens, settings.RATE_LIMIT_MAX_WAIT)
+        if wait is None:
+            raise RateLimitExceeded(provider, settings.RATE_LIMIT_MAX_WAIT)
+        if wait:
+            time.sleep(wait)
+        RATE_LIMIT_WAIT.observe(provider, value=wait)
+        return wait
+
+
+@contextmanager
+def provider_request(provider, credential, observe=None):
+    """
+    Wait for the rate limit token of a provider request, then time the request.
+
+    The latency is recorded in `PROVIDER_LATENCY` and handed to `observe`, the circuit breaker of the provider, from the
+    thread sending the request, so the wait for the token never counts as provider latency.
+
+    Exp:
+        >>> with provider_request("kavenegar", api_key, breaker.observe):
+        ...     session.post(url, data=params)
+        >>> with provider_request("google", HTTPSessionPool.origin(endpoint)):
+        ...     webpush(subscription_info=subscription_info, data=data)
+    """
+    RateLimiter().acquire(provider, credential)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        PROVIDER_LATENCY.observe(provider, value=duration)
+        if observe is not None:
+            observe(duration)
@@ -1,15 +1,25 @@
 from src.core import settings
-from src.helpers.sms_proxy.services import KavenegarService
+from src.core.log import logger
+from src.core.metrics import Counter
+from src.core.tracing import traced
+from src.helpers.circuit_breaker import CircuitOpenError
+from src.helpers.fan_out import GroupResult
+from src.helpers.sms_proxy.registry import ProviderRegistry
 from src.helpers.sms_proxy.services import MessagingService
-from src.helpers.sms_proxy.services import TwilioService
+
+FAILOVERS = Counter("notification_sms_failovers_total", "Sends moved to the alternate provider while the breaker of the primary was open.", ("provider", "alternate"))
 
 
 class SMSServiceProxy(MessagingService):
     """A proxy service for sending SMS messages using Kavenegar or Twilio based on the recipient's phone number prefix.
 
     This class extends `MessagingService` and is designed to send SMS messages using either the Kavenegar or Twilio service
-    based on the recipient's phone number prefix (e.g., +98 for Iranian phone numbers). It contains methods for sending single
-    messages, OTP messages, and group messages.
+    based on the recipient's phone number prefix (e.g., +98 or the national 09 for Iranian phone numbers). It contains methods
+    for sending single messages, OTP messages, and group messages.
+
+    When the circuit breaker of the chosen provider is open, the message is sent with the alternate provider of
+    `settings.SMS_FAILOVER`, if any. Failover only follows `CircuitOpenError`, which guarantees the primary sent nothing;
+    a timed out send may have reached the recipient and is left to the retry queues instead of being sent twice.
 
     Methods:
         send_single_message(recipient, message):
@@ -24,9 +34,57 @@ class SMSServiceProxy(MessagingService):
     """
 
     def __init__(self):
-        self.kavenegar_service = KavenegarService(settings.KAVEHNEGAR_API_KEY)
-        self.twilio_service = TwilioService(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        # provider clients are shared by the process, building a proxy per message costs no new connection.
+        self.kavenegar_service = ProviderRegistry().kavenegar(settings.KAVEHNEGAR_API_KEY)
+        self.twilio_service = ProviderRegistry().twilio(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        self.services = {"kavenegar": self.kavenegar_service, "twilio": self.twilio_service}
+
+    @staticmethod
+    def _is_iranian(recipient):
+        # the validators only accept the national format ("09..."), which Kavenegar takes as it is.
+        return recipient.startswith(("+98", "09"))
+
+    @staticmethod
+    def _e164(recipient):
+        # Twilio only takes E.164 numbers and refuses the national format with a permanent 400.
+        return f"+98{recipient[1:]}" if recipient.startswith("09") else recipient
+
+    def _call(self, provider, method, recipients, *args):
+        """
+        Call a provider with the recipients in the format it takes.
 
+        Twilio gets the national Iranian numbers of mixed groups and of failed over messages in E.164 ("09..." becomes
+        "+989..."), the `GroupResult` of a group is reported with the recipients of the message.
+        """
+        if provider != "twilio":
+            return getattr(self.services[provider], method)(recipients, *args)
+        if isinstance(recipients, str):
+            return getattr(self.services[provider], method)(self._e164(recipients), *args)
+
+        numbers = [self._e164(recipient) for recipient in recipients]
+        result = getattr(self.services[provider], method)(numbers, *args)
+        if not isinstance(result, GroupResult):
+            return result
+        originals = dict(zip(numbers, recipients))
+        reported = GroupResult()
+        for number in result.succeeded:
+            reported.add(originals[number])
+        for number, error in result.errors.items():
+            reported.add(originals[number], error)
+        return reported
+
+    def _send(self, provider, method, *args):
+        try:
+            return self._call(provider, method, *args)
+        except CircuitOpenError:
+            alternate = settings.SMS_FAILOVER.get(provider)
+            if alternate is None:
+                raise
+            logger.warning("%s is unavailable, failing over to %s.", provider, alternate, extra={"sample": True})
+            FAILOVERS.inc(provider, alternate)
+            return self._call(alternate, method, *args)
+
+    @traced("provider.sms")
     def send_single_message(self, recipient, message):
         """Send a single SMS message to the specified recipient.
 
@@ -37,12 +95,13 @@ class SMSServiceProxy(MessagingService):
         Returns:
             bool: True if the message was successfully sent, False otherwise.
         """
-        if recipient.startswith("+98"):  # Iranian phone numbers
-            self.kavenegar_service.send_single_message(recipient, message)
+        if self._is_iranian(recipient):
+            self._send("kavenegar", "send_single_message", recipient, message)
         else:
-            self.twilio_service.send_single_message(recipient, message)
+            self._send("twilio", "send_single_message", recipient, message)
         return True
 
+    @traced("provider.sms")
     def send_otp_message(self, recipient, otp_code):
         """Send an OTP (One-Time Password) SMS message to the specified recipient.
 
@@ -53,12 +112,13 @@ class SMSServiceProxy(MessagingService):
         Returns:
             bool: True if the OTP message was successfully sent, False otherwise.
         """
-        if recipient.startswith("+98"):  # Iranian phone numbers
-            self.kavenegar_service.send_otp_message(recipient, otp_code)
+        if self._is_iranian(recipient):
+            self._send("kavenegar", "send_otp_message", recipient, otp_code)
         else:
-            self.twilio_service.send_otp_message(recipient, otp_code)
+            self._send("twilio", "send_otp_message", recipient, otp_code)
         return True
 
+    @traced("provider.sms")
     def send_group_message(self, recipients, message):
         """Send a group SMS message to a list of recipients.
 
@@ -67,10 +127,9 @@ class SMSServiceProxy(MessagingService):
             message (str): The message content to be sent to all recipients.
 
         Returns:
-            bool: True if the group message was successfully sent, False otherwise.
+            GroupResult: The recipients that succeeded, failed or were throttled, truthy if all of them were sent.
         """
-        if all("+98" in recipient for recipient in recipients):  # Iranian phone numbers
-            self.kavenegar_service.send_group_message(recipients, message)
+        if all(self._is_iranian(recipient) for recipient in recipients):
+            return self._send("kavenegar", "send_group_message", recipients, message)
         else:
-            self.twilio_service.send_group_message(recipients, message)
-        return True
+            return self._send("twilio", "send_group_message", recipients, message)
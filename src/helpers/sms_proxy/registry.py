@@ -0,0 +1,48 @@
+import threading
+
+from src.core import settings
+from src.helpers.circuit_breaker import CircuitBreaker
+from src.helpers.sms_proxy.services import GuardedService
+from src.helpers.sms_proxy.services import KavenegarService
+from src.helpers.sms_proxy.services import TwilioService
+
+
+class ProviderRegistry:
+    """Process wide registry of provider clients.
+
+    Clients are built once per credential and shared by every sender of the process, together with the keep-alive
+    connections of their `HTTPSessionPool` sessions and, with `settings.CIRCUIT_BREAKER_ENABLED`, their circuit breaker.
+
+    Exp:
+        >>> ProviderRegistry().kavenegar(settings.KAVEHNEGAR_API_KEY).send_single_message("+989101111111", "salam")
+        True
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    instance = super(ProviderRegistry, cls).__new__(cls)
+                    instance._clients = {}
+                    instance._lock = threading.Lock()
+                    cls.instance = instance
+        return cls.instance
+
+    def _get(self, key, factory):
+        with self._lock:
+            if key not in self._clients:
+                if settings.CIRCUIT_BREAKER_ENABLED:
+                    # the client reports the latency of its requests to the breaker from the thread sending them.
+                    breaker = CircuitBreaker(key[0])
+                    self._clients[key] = GuardedService(factory(breaker.observe), breaker)
+                else:
+                    self._clients[key] = factory(None)
+            return self._clients[key]
+
+    def kavenegar(self, api_key):
+        return self._get(("kavenegar", api_key), lambda observe: KavenegarService(api_key, observe=observe))
+
+    def twilio(self, account_sid, auth_token):
+        return self._get(("twilio", account_sid, auth_token), lambda observe: TwilioService(account_sid, auth_token, observe=observe))
@@ -1,8 +1,18 @@
+import json
 from abc import ABC
 from abc import abstractmethod
 
+import requests
+from kavenegar import APIException
+from kavenegar import HTTPException
 from kavenegar import KavenegarAPI
 from src.core import settings
+from src.helpers.batching import MicroBatcher
+from src.helpers.fan_out import FanOut
+from src.helpers.fan_out import GroupResult
+from src.helpers.http_pool import HTTPSessionPool
+from src.helpers.rate_limit import provider_request
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 
 
@@ -51,6 +61,71 @@ class MessagingService(ABC):
         """
 
 
+class GuardedService(MessagingService):
+    """Messaging service calling another one through its provider's circuit breaker.
+
+    While the breaker is open every call raises `CircuitOpenError` at once instead of waiting for the provider timeout.
+    """
+
+    def __init__(self, service, breaker):
+        self.service = service
+        self.breaker = breaker
+
+    def send_single_message(self, recipient, message):
+        return self.breaker.call(self.service.send_single_message, recipient, message)
+
+    def send_otp_message(self, recipient, otp_code):
+        return self.breaker.call(self.service.send_otp_message, recipient, otp_code)
+
+    def send_group_message(self, recipients, message):
+        return self.breaker.call(self.service.send_group_message, recipients, message)
+
+
+KAVEHNEGAR_FAILED_STATUSES = {6, 11, 13, 14, 100}  # failed, undelivered, canceled, blocked by receptor, unknown
+
+
+class PooledKavenegarAPI(KavenegarAPI):
+    """`KavenegarAPI` sending its requests through the keep-alive session of `HTTPSessionPool`.
+
+    The upstream client posts with the module level `requests.post`, which opens a new TCP/TLS connection per call.
+    Every request waits for a token of the rate limit of its api key, its latency is reported to `observe`.
+    """
+
+    def __init__(self, apikey, observe=None, **kwargs):
+        super().__init__(apikey, **kwargs)
+        self.observe = observe
+
+    def _request(self, action, method, params=None):
+        url = f"{settings.KAVEHNEGAR_BASE_URL}/{self.version}/{self.apikey}/{action}/{method}.json"
+        try:
+            with provider_request("kavenegar", self.apikey, self.observe):
+                content = HTTPSessionPool().session(url).post(url, headers=self.headers, data=params or {}, timeout=settings.KAVEHNEGAR_TIMEOUT).content
+            try:
+                response = json.loads(content.decode("utf-8"))
+                if response["return"]["status"] == 200:
+                    response = response["entries"]
+                else:
+                    raise APIException(f"APIException[{response['return']['status']}] {response['return']['message']}".encode("utf-8"))
+            except ValueError as e:
+                raise HTTPException(e)
+            return response
+        except requests.exceptions.RequestException as e:
+            raise HTTPException(e)
+
+
+class TimedTwilioHttpClient(TwilioHttpClient):
+    """`TwilioHttpClient` rate limiting every request per account and reporting its latency to `observe`."""
+
+    def __init__(self, account_sid, observe=None, **kwargs):
+        super().__init__(**kwargs)
+        self.account_sid = account_sid
+        self.observe = observe
+
+    def request(self, *args, **kwargs):
+        with provider_request("twilio", self.account_sid, self.observe):
+            return super().request(*args, **kwargs)
+
+
 class KavenegarService(MessagingService):
     """Messaging service using Kavenegar API for sending SMS messages.
 
@@ -58,13 +133,19 @@ class KavenegarService(MessagingService):
     Kavenegar API.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, observe=None):
 
-        self.kavenegar_api = KavenegarAPI(api_key)
+        self.kavenegar_api = PooledKavenegarAPI(api_key, observe=observe)
+        self.batcher = MicroBatcher(
+            flush=self._send_batch, max_size=settings.KAVEHNEGAR_SENDARRAY_LIMIT, max_wait=settings.KAVEHNEGAR_BATCH_WINDOW, name="kavenegar-batcher"
+        )
 
     def send_single_message(self, recipient, message):
         """Send a single SMS message using the Kavenegar service.
 
+        With `settings.KAVEHNEGAR_BATCH_SINGLE` the message waits up to `settings.KAVEHNEGAR_BATCH_WINDOW` milliseconds
+        for other single messages and is sent with them in one `sms_sendarray` call.
+
         Args:
             recipient (str): The recipient's phone number.
             message (str): The message content to be sent.
@@ -73,6 +154,10 @@ class KavenegarService(MessagingService):
             bool: True if the message was successfully sent, False otherwise.
         """
 
+        if settings.KAVEHNEGAR_BATCH_SINGLE:
+            timeout = settings.KAVEHNEGAR_BATCH_WINDOW / 1000 + settings.RATE_LIMIT_MAX_WAIT + settings.KAVEHNEGAR_TIMEOUT
+            return self.batcher.send(settings.KAVEHNEGAR_DEDICATED_NUMBER, (recipient, message), timeout=timeout)
+
         params = {
             "sender": settings.KAVEHNEGAR_DEDICATED_NUMBER,
             "receptor": recipient,
@@ -112,25 +197,65 @@ class KavenegarService(MessagingService):
     def send_group_message(self, recipients, message):
         """Send a group SMS message using the Kavenegar service.
 
+        The recipients are sent in `sms_sendarray` calls of `settings.KAVEHNEGAR_SENDARRAY_LIMIT`, a failing call
+        fails the recipients of its chunk only and does not stop the following chunks.
+
         Args:
             recipients (list): A list of recipient phone numbers.
             message (str): The message content to be sent to all recipients.
 
         Returns:
-            bool: True if the group message was successfully sent, False otherwise.
+            GroupResult: The recipients that succeeded, failed or were throttled, truthy if all of them were sent.
+        """
+
+        limit = settings.KAVEHNEGAR_SENDARRAY_LIMIT
+        result = GroupResult()
+        for index in range(0, len(recipients), limit):
+            chunk = recipients[index : index + limit]
+            params = {
+                "sender": settings.KAVEHNEGAR_DEDICATED_NUMBER,
+                "receptor": chunk,
+                "message": [message] * len(chunk),
+            }
+            try:
+                self.kavenegar_api.sms_sendarray(params)
+            except Exception as e:
+                error = Exception(f"Kavenegar: Error sending group messages: {e}")
+                error.__cause__ = e  # classified by the error of the provider, like a raised one.
+            else:
+                error = None
+            for recipient in chunk:
+                result.add(recipient, error)
+
+        return result
+
+    def _send_batch(self, sender, messages):
+        """Send batched single messages in one `sms_sendarray` call.
+
+        Args:
+            sender (str): The dedicated number the messages are sent from.
+            messages (list): A list of (recipient, message) tuples, at most `settings.KAVEHNEGAR_SENDARRAY_LIMIT`.
+
+        Returns:
+            list: True for every sent message, an exception for every message Kavenegar refused, in order.
         """
 
         params = {
-            "sender": settings.KAVEHNEGAR_DEDICATED_NUMBER,
-            "receptor": recipients,
-            "message": [message] * len(recipients),
+            "sender": sender,
+            "receptor": [recipient for recipient, _ in messages],
+            "message": [message for _, message in messages],
         }
         try:
-            self.kavenegar_api.sms_sendarray(params)
+            entries = self.kavenegar_api.sms_sendarray(params)
         except Exception as e:
-            raise Exception(f"Kavenegar: Error sending group messages: {e}")
+            raise Exception(f"Kavenegar: Error sending single messages: {e}")
 
-        return True
+        if len(entries) != len(messages):
+            raise Exception(f"Kavenegar: Error sending single messages: {len(entries)} results for {len(messages)} messages")
+        return [
+            Exception(f"Kavenegar: Error sending single message: {entry.get('statustext')}") if entry.get("status") in KAVEHNEGAR_FAILED_STATUSES else True
+            for entry in entries
+        ]
 
 
 class TwilioService(MessagingService):
@@ -140,9 +265,12 @@ class TwilioService(MessagingService):
     Twilio service.
     """
 
-    def __init__(self, account_sid, auth_token):
+    def __init__(self, account_sid, auth_token, observe=None):
 
-        self.twilio_client = Client(account_sid, auth_token)
+        http_client = TimedTwilioHttpClient(account_sid, observe=observe, timeout=settings.TWILIO_TIMEOUT)
+        http_client.session = HTTPSessionPool().session(settings.TWILIO_BASE_URL)
+        self.twilio_client = Client(account_sid, auth_token, http_client=http_client)
+        self.twilio_client.api.base_url = settings.TWILIO_BASE_URL
 
     def send_single_message(self, recipient, message):
         """Send a single SMS message using the Twilio service.
@@ -193,24 +321,26 @@ class TwilioService(MessagingService):
     def send_group_message(self, recipients, message):
         """Send a group SMS message using the Twilio service.
 
+        Twilio has no bulk endpoint, so one message is created per recipient, `settings.TWILIO_GROUP_PARALLELISM` at a
+        time, and a failing recipient does not stop the others.
+
         Args:
             recipients (list): A list of recipient phone numbers.
             message (str): The message content to be sent to all recipients.
 
         Returns:
-            bool: True if the group message was successfully sent, False otherwise.
+            GroupResult: The recipients that succeeded, failed or were throttled, truthy if all of them were sent.
         """
 
-        try:
-            for recipient in recipients:
-                params = {
-                    "body": message,
-                    "from_": settings.TWILIO_DEDICATED_NUMBER,
-                    "to": recipient,
-                }
+        def send(recipient):
+            params = {
+                "body": message,
+                "from_": settings.TWILIO_DEDICATED_NUMBER,
+                "to": recipient,
+            }
+            try:
                 self.twilio_client.messages.create(**params)
+            except Exception as e:
+                raise Exception(f"Twilio: Error sending group message to {recipient}: {e}")
 
-        except Exception as e:
-            raise Exception(f"Twilio: Error sending group message: {e}")
-
-        return True
+        return FanOut().run(send, ((recipient,) for recipient in recipients), parallelism=settings.TWILIO_GROUP_PARALLELISM)
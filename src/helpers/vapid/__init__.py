@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+from py_vapid import Vapid
+from src.core import settings
+from src.helpers.http_pool import HTTPSessionPool
+
+
+class VapidHeaderCache:
+    """Signed VAPID `Authorization` headers cached per push service origin.
+
+    The VAPID claims only depend on the audience (the origin of the subscription endpoint) and the expiry, so one ES256
+    signature per origin serves every push to it until `settings.VAPID_REFRESH_MARGIN` seconds before its `exp`, when
+    the header is signed again. The cache keeps the `settings.VAPID_CACHE_SIZE` most recently used origins.
+
+    Exp:
+        >>> VapidHeaderCache().headers("https://fcm.googleapis.com/fcm/send/fzSRCOGWEns:APA91b...")
+        {'Authorization': 'vapid t=eyJ0eXAiOiJKV1QiLCJhbGciOiJFUzI1NiJ9...,k=BOiZ9aq-ABL79Wtno9hr4Rnq...'}
+    """
+
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if not hasattr(cls, "instance"):
+            with cls._instance_lock:
+                if not hasattr(cls, "instance"):
+                    instance = super(VapidHeaderCache, cls).__new__(cls)
+                    instance._vapid = Vapid.from_string(private_key=settings.VAPID_PRIVATE_KEY)
+                    instance._headers = OrderedDict()
+                    instance._lock = threading.Lock()
+                    cls.instance = instance
+        return cls.instance
+
+    def headers(self, endpoint):
+        """
+        Get the VAPID headers for a subscription endpoint.
+
+        Args:
+            endpoint (str): The push subscription endpoint.
+
+        Returns:
+            dict: A copy of the headers, safe to extend per request.
+        """
+        audience = HTTPSessionPool.origin(endpoint)
+        now = time.time()
+        with self._lock:
+            cached = self._headers.get(audience)
+            if cached is not None and cached[0] - settings.VAPID_REFRESH_MARGIN > now:
+                self._headers.move_to_end(audience)
+                return dict(cached[1])
+
+        expiration = int(now) + settings.VAPID_EXPIRATION
+        headers = self._vapid.sign({**settings.VAPID_CLAIMS, "aud": audience, "exp": expiration})
+
+        with self._lock:
+            self._headers[audience] = (expiration, headers)
+            self._headers.move_to_end(audience)
+            while len(self._headers) > settings.VAPID_CACHE_SIZE:
+                self._headers.popitem(last=False)
+        return dict(headers)
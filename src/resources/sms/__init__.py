@@ -1,3 +1,6 @@
+from src.core import settings
+from src.helpers.fan_out import FanOut
+from src.helpers.idempotency import idempotent
 from src.helpers.sms_proxy import SMSServiceProxy
 from src.resources.sms.validators import group_validation
 from src.resources.sms.validators import otp_group_validation
@@ -11,6 +14,7 @@ class Send:
     """
 
     @classmethod
+    @idempotent
     def single(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to send a single message.
@@ -67,6 +71,7 @@ class Send:
         return True
 
     @classmethod
+    @idempotent
     def group(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to send group messages.
@@ -77,7 +82,7 @@ class Send:
             **kwargs: Any additional keyword arguments.
 
         Returns:
-            bool: True if the SMS message is sent successfully, False otherwise.
+            GroupResult: The outcome of every recipient, truthy if all of them were sent.
 
         Raises:
             ValueError: If the properties are invalid.
@@ -87,7 +92,7 @@ class Send:
         Example:
             >>> Send.group(response={"application": "app", "created_time": "2023-02-28 15:30:00",
             "data": { "receptor": ["+989101111111", "+989101111112"], "message": "Hello, world!", "type": "group"}})
-            True
+            GroupResult(succeeded=2, failed=0, throttled=0)
         """
 
         group_validation(response=response)
@@ -108,7 +113,7 @@ class Send:
             **kwargs: Any additional keyword arguments.
 
         Returns:
-            bool: True if the SMS message is sent successfully, False otherwise.
+            GroupResult: The outcome of every recipient, truthy if all of them were sent.
 
         Raises:
             APIException: If there is an error with the KavenegarAPI.
@@ -116,14 +121,13 @@ class Send:
 
         Example:
             >>> Send._group(phone_numbers=["+989101111111", "+989101111112"], text="Hello world")
-            True
+            GroupResult(succeeded=2, failed=0, throttled=0)
         """
 
-        SMSServiceProxy().send_group_message(message=text, recipients=phone_numbers)
-
-        return True
+        return SMSServiceProxy().send_group_message(message=text, recipients=phone_numbers)
 
     @classmethod
+    @idempotent
     def single_otp(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to send a otp message.
@@ -180,6 +184,7 @@ class Send:
         return True
 
     @classmethod
+    @idempotent
     def group_otp(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to send group otp message.
@@ -190,17 +195,15 @@ class Send:
             **kwargs: Any additional keyword arguments.
 
         Returns:
-            bool: True if the SMS message is sent successfully, False otherwise.
+            GroupResult: The outcome of every recipient, truthy if all of them were sent.
 
         Raises:
             ValueError: If the properties are invalid.
-            APIException: If there is an error with the KavenegarAPI.
-            HTTPException: If there is an error with the HTTP request.
 
         Example:
             >>> Send.group_otp(response={"application": "app", "created_time": "2023-02-28 15:30:00",
             "data": { "receptor": ["+989101111111", "+989101111112"], "message": ["32423","45379"], "type": "group_otp"}})
-            True
+            GroupResult(succeeded=2, failed=0, throttled=0)
         """
         otp_group_validation(response=response)
         phone_nubmers = response["data"]["receptor"]
@@ -212,6 +215,9 @@ class Send:
         """
         Sends a group otp SMS message to a list of specified phone numbers with the given otp messages.
 
+        The otp messages are sent concurrently, `settings.SMS_GROUP_OTP_PARALLELISM` at a time, and a failing phone number
+        does not stop the others.
+
         Args:
             phone_numbers (list): A list of phone numbers to which the SMS message will be sent.
             texts (list): A list of otp messages to be sent.
@@ -219,18 +225,16 @@ class Send:
             **kwargs: Any additional keyword arguments.
 
         Returns:
-            bool: True if the SMS message is sent successfully, False otherwise.
-
-        Raises:
-            APIException: If there is an error with the KavenegarAPI.
-            HTTPException: If there is an error with the HTTP request.
+            GroupResult: The outcome of every phone number, truthy if all of them were sent.
 
         Example:
             >>> Send._group_otp(phone_numbers=["+989101111111", "+989101111112"], texts=["7589", "1234"])
-            True
+            GroupResult(succeeded=2, failed=0, throttled=0)
         """
 
-        for phone_number, text in zip(phone_numbers, texts):
-            SMSServiceProxy().send_otp_message(otp_code=text, recipient=phone_number)
+        proxy = SMSServiceProxy()
 
-        return True
+        def send(phone_number, text):
+            return proxy.send_otp_message(otp_code=text, recipient=phone_number)
+
+        return FanOut().run(send, zip(phone_numbers, texts), parallelism=settings.SMS_GROUP_OTP_PARALLELISM)
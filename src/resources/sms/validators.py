@@ -2,7 +2,11 @@ import re
 from datetime import datetime
 from typing import List
 
+from src.core.tracing import traced
+from src.helpers.json_parser import InvalidMessage
 
+
+@traced("validate")
 def single_validation(response, *args, **kwargs):
     """
     Validate response properties.
@@ -33,6 +37,7 @@ def single_validation(response, *args, **kwargs):
     return True
 
 
+@traced("validate")
 def group_validation(response, *args, **kwargs):
     """
     Validate response properties.
@@ -63,6 +68,7 @@ def group_validation(response, *args, **kwargs):
     return True
 
 
+@traced("validate")
 def otp_single_validation(response, *args, **kwargs):
     """
     Validate response properties.
@@ -93,6 +99,7 @@ def otp_single_validation(response, *args, **kwargs):
     return True
 
 
+@traced("validate")
 def otp_group_validation(response, *args, **kwargs):
     """
     Validate response properties.
@@ -144,7 +151,7 @@ def validate_phone_number(phonenumber: str):
     pattern = r"^09[0-3,9]\d{8}$"
     match = re.match(pattern, phonenumber)
     if not match:
-        raise ValueError("Invalid phone number")
+        raise InvalidMessage("Invalid phone number")
     return True
 
 
@@ -196,6 +203,6 @@ def validate_created_time(created_time):
         datetime.strptime(created_time, datetime_format)
 
     except ValueError:
-        raise ValueError("Invalid date time")
+        raise InvalidMessage("Invalid date time")
     else:
         return True
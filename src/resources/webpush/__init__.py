@@ -1,9 +1,14 @@
-import json
-
-import requests
 from pywebpush import webpush
 from src.core import settings
+from src.core.tracing import traced
+from src.helpers import codec
+from src.helpers.batching import MicroBatcher
+from src.helpers.http_pool import HTTPSessionPool
+from src.helpers.idempotency import idempotent
+from src.helpers.rate_limit import provider_request
+from src.helpers.vapid import VapidHeaderCache
 from src.resources.webpush.validators import chabok_validation
+from src.resources.webpush.validators import decode_google_subscription_info
 from src.resources.webpush.validators import google_validation
 from src.resources.webpush.validators import vapid_key_validation
 
@@ -49,6 +54,7 @@ class Push:
         return settings.VAPID_PUBLIC_KEY
 
     @classmethod
+    @idempotent
     def google(cls, response, *args, **kwargs):
         """
         Validates response properties and prepares to push a single notification by Google APIs.
@@ -71,19 +77,20 @@ class Push:
             ...                        "data": {"receptor": "09101111111", "message": "salam", "type": "single"}})
             True
         """
-        google_validation(response=response)
-        subscription_info = json.loads(response["subscription_info"])
-        data = json.dumps(response["data"])
+        subscription_info = decode_google_subscription_info(response["subscription_info"])
+        google_validation(response=response, subscription_info=subscription_info)
+        data = codec.dumps(response["data"])
         return cls._google(subscription_info=subscription_info, data=data, *args, **kwargs)
 
     @classmethod
+    @traced("provider.google")
     def _google(cls, subscription_info, data, *args, **kwargs):
         """
         Sends a single push notification using the Google push notification service.
 
         Args:
             subscription_info (dict): A dictionary containing the subscription info for the user.
-            data (str): A JSON-encoded string containing the data to be sent to the Google service.
+            data (bytes): The JSON-encoded data to be sent to the Google service.
             *args: Additional positional arguments to be ignored.
             **kwargs: Additional keyword arguments to be ignored.
 
@@ -94,11 +101,21 @@ class Push:
             Exception: If the request to the Google service fails with a non-200 status code.
         """
 
-        webpush(subscription_info=subscription_info, data=data, vapid_private_key=settings.VAPID_PRIVATE_KEY, vapid_claims=settings.VAPID_CLAIMS)
+        # VAPID headers come signed from the cache, so pywebpush gets no claims to sign per message.
+        headers = VapidHeaderCache().headers(subscription_info["endpoint"])
+        with provider_request("google", HTTPSessionPool.origin(subscription_info["endpoint"])):
+            webpush(
+                subscription_info=subscription_info,
+                data=data,
+                headers=headers,
+                timeout=settings.WEBPUSH_TIMEOUT,
+                requests_session=HTTPSessionPool().session(subscription_info["endpoint"]),
+            )
 
         return True
 
     @classmethod
+    @idempotent
     def single_chabok(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to push a single notification by Chabok APIs.
@@ -116,9 +133,42 @@ class Push:
         """
         chabok_validation(response=response)
         data = response
+        if settings.CHABOK_COALESCE:
+            return cls._coalesced_chabok(data=data, *args, **kwargs)
         return cls._single_chabok(data=data, *args, **kwargs)
 
     @classmethod
+    @traced("provider.chabok")
+    def _coalesced_chabok(cls, data, *args, **kwargs):
+        """
+        Queues a single push notification to be sent with other single pushes of the same content in one group request.
+
+        Args:
+            data (dict): A dictionary containing the data to be sent to the Chabok service.
+            *args: Additional positional arguments to be ignored.
+            **kwargs: Additional keyword arguments to be ignored.
+
+        Returns:
+            bool: True if the group request carrying the push notification was successfully sent.
+
+        Raises:
+            Exception: If the group request to the Chabok service fails with a non-200 status code.
+            TimeoutError: If the group request did not start within the window, rate limit wait and Chabok timeout; the
+                push is withdrawn from the group first, so the retried delivery is not pushed twice. A push whose group
+                request already started waits for its outcome.
+        """
+        key = (data["content"], data["notification"]["title"], data["notification"]["body"])
+        timeout = settings.CHABOK_COALESCE_WINDOW / 1000 + settings.RATE_LIMIT_MAX_WAIT + settings.CHABOK_TIMEOUT
+        return chabok_coalescer.send(key, data["user"], timeout=timeout)
+
+    @classmethod
+    def _flush_coalesced_chabok(cls, key, users):
+        content, title, body = key
+        cls._group_chabok(data={"users": users, "content": content, "notification": {"title": title, "body": body}})
+        return [True] * len(users)
+
+    @classmethod
+    @traced("provider.chabok")
     def _single_chabok(cls, data, *args, **kwargs):
         """
         Sends a single push notification to a user using the Chabok push notification service.
@@ -151,11 +201,9 @@ class Push:
             },
         )
 
-        req = requests.post(
-            f"https://{settings.CHABOK['APP_ID']}.push.adpdigital.com/api/push/toUsers?access_token={settings.CHABOK['ACCESS_TOKEN']}",
-            headers=headers,
-            json=json_data,
-        )
+        url = f"{settings.CHABOK_BASE_URL.format(app_id=settings.CHABOK['APP_ID'])}/api/push/toUsers?access_token={settings.CHABOK['ACCESS_TOKEN']}"
+        with provider_request("chabok", settings.CHABOK["APP_ID"]):
+            req = HTTPSessionPool().session(url).post(url, headers=headers, json=json_data, timeout=settings.CHABOK_TIMEOUT)
 
         if req.status_code == 200:
             return True
@@ -163,6 +211,7 @@ class Push:
             raise Exception(f"Request failed with status code {req.status_code}")
 
     @classmethod
+    @idempotent
     def group_chabok(cls, response, *args, **kwargs):
         """
         Validate response properties and prepare to push a group notification by Chabok APIs.
@@ -184,6 +233,7 @@ class Push:
         return cls._group_chabok(data=data, *args, **kwargs)
 
     @classmethod
+    @traced("provider.chabok")
     def _group_chabok(cls, data, *args, **kwargs):
         """
         Sends a group push notification to  users using the Chabok push notification service.
@@ -216,13 +266,16 @@ class Push:
             },
         )
 
-        req = requests.post(
-            f"https://{settings.CHABOK['APP_ID']}.push.adpdigital.com/api/push/toUsers?access_token={settings.CHABOK['ACCESS_TOKEN']}",
-            headers=headers,
-            json=json_data,
-        )
+        url = f"{settings.CHABOK_BASE_URL.format(app_id=settings.CHABOK['APP_ID'])}/api/push/toUsers?access_token={settings.CHABOK['ACCESS_TOKEN']}"
+        with provider_request("chabok", settings.CHABOK["APP_ID"]):
+            req = HTTPSessionPool().session(url).post(url, headers=headers, json=json_data, timeout=settings.CHABOK_TIMEOUT)
 
         if req.status_code == 200:
             return True
         else:
             raise Exception(f"Request failed with status code {req.status_code}")
+
+
+chabok_coalescer = MicroBatcher(
+    flush=Push._flush_coalesced_chabok, max_size=settings.CHABOK_COALESCE_MAX_USERS, max_wait=settings.CHABOK_COALESCE_WINDOW, name="chabok-coalescer"
+)
@@ -1,7 +1,11 @@
-import json
 from datetime import datetime
 
+from src.core.tracing import traced
+from src.helpers import codec
+from src.helpers.json_parser import InvalidMessage
 
+
+@traced("validate")
 def vapid_key_validation(response, *args, **kwargs):
 
     validation_functions = [
@@ -13,12 +17,14 @@ def vapid_key_validation(response, *args, **kwargs):
     return True
 
 
-def google_validation(response, *args, **kwargs):
+@traced("validate")
+def google_validation(response, subscription_info=None, *args, **kwargs):
     """
     Validates the properties of a Google Cloud Messaging response.
 
     Args:
         response (dict): A dictionary containing the response properties.
+        subscription_info (dict, optional): The already decoded `response["subscription_info"]`, decoded here if omitted.
         *args: Additional positional arguments.
         **kwargs: Additional keyword arguments.
 
@@ -45,7 +51,7 @@ def google_validation(response, *args, **kwargs):
     """
 
     validation_functions = [
-        {"name": validate_google_subscription_info, "args": [response["subscription_info"]]},
+        {"name": validate_google_subscription_info, "args": [response["subscription_info"] if subscription_info is None else subscription_info]},
         {"name": validate_created_time, "args": [response["created_time"]]},
     ]
     for func in validation_functions:
@@ -53,6 +59,7 @@ def google_validation(response, *args, **kwargs):
     return True
 
 
+@traced("validate")
 def chabok_validation(response, *args, **kwargs):
     """
     Validates the properties of a Chabok notification request.
@@ -90,37 +97,53 @@ def chabok_validation(response, *args, **kwargs):
     return True
 
 
+def decode_google_subscription_info(subscription_info):
+    """
+    Decodes the JSON-encoded subscription info of a Google push notification.
+
+    Args:
+        subscription_info (str): A JSON-encoded string representing the subscription info dictionary.
+
+    Returns:
+        dict: The subscription info dictionary.
+
+    Raises:
+        InvalidMessage: If the subscription info can't be decoded to a dictionary.
+    """
+    try:
+        subscription_dict = codec.loads(subscription_info)
+    except ValueError:
+        raise InvalidMessage("subscription info can't be decode to dictionary")
+    if not isinstance(subscription_dict, dict):
+        raise InvalidMessage("subscription info can't be decode to dictionary")
+    return subscription_dict
+
+
 def validate_google_subscription_info(subscription_info):
     """
     Validates a subscription info dictionary for a Google push notification.
 
     Args:
-        subscription_info (str): A JSON-encoded string representing the subscription info dictionary.
+        subscription_info (dict | str): The subscription info dictionary, or its JSON-encoded string.
 
     Returns:
         bool: True if the subscription info dictionary is valid, False otherwise.
 
     Raises:
-        Exception: If the subscription info dictionary is invalid.
+        InvalidMessage: If the subscription info dictionary is invalid.
 
     Example:
         subscription_info = '{"endpoint": "https://fcm.googleapis.com/fcm/send/cXNtMTZfYz...","expirationTime": null,"keys": {"p256dh": "...", "auth": "..."}}'
         validate_google_subscription_info(subscription_info)
     """
 
-    try:
-        subscription_dict = json.loads(subscription_info)
-        subscription_dict["expirationTime"] = "" if subscription_dict["expirationTime"] is None else subscription_dict["expirationTime"]
-
-    except json.decoder.JSONDecodeError:
-        raise Exception("subscription info can't be decode to dictionary")
+    subscription_dict = subscription_info if isinstance(subscription_info, dict) else decode_google_subscription_info(subscription_info)
 
-    else:
-        for key, value_type in {"endpoint": str, "expirationTime": str, "keys": dict}.items():
-            if key not in subscription_dict.keys():
-                raise Exception("subscription info doesn't have sufficient properties")
-            if not isinstance(subscription_dict[key], value_type):
-                raise Exception(f"subscription info doesn't have match property datatype, `{key}`")
+    for key, value_type in {"endpoint": str, "expirationTime": (str, type(None)), "keys": dict}.items():
+        if key not in subscription_dict.keys():
+            raise InvalidMessage("subscription info doesn't have sufficient properties")
+        if not isinstance(subscription_dict[key], value_type):
+            raise InvalidMessage(f"subscription info doesn't have match property datatype, `{key}`")
 
     return True
 
@@ -148,6 +171,6 @@ def validate_created_time(created_time):
         datetime.strptime(created_time, datetime_format)
 
     except ValueError:
-        raise ValueError("Invalid date time")
+        raise InvalidMessage("Invalid date time")
     else:
         return True
@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import PublicFormat
+from py_vapid import Vapid
+from py_vapid.utils import b64urlencode
+
+
+def pytest_configure(config):
+    # the settings read the VAPID keys on import and the keys are never committed, the tests sign with a throwaway pair.
+    vapid = Vapid()
+    vapid.generate_keys()
+    config.vapid_directory = tempfile.mkdtemp(prefix="tests-vapid-")
+    keys = {
+        "VAPID_PRIVATE_KEY_FILE": vapid.private_key.private_numbers().private_value.to_bytes(32, "big"),
+        "VAPID_PUBLIC_KEY_FILE": vapid.public_key.public_bytes(Encoding.X962, PublicFormat.UncompressedPoint),
+    }
+    for name, key in keys.items():
+        os.environ[name] = os.path.join(config.vapid_directory, name.lower())
+        with open(os.environ[name], "w") as key_file:
+            key_file.write(b64urlencode(key))
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(getattr(config, "vapid_directory", ""), ignore_errors=True)
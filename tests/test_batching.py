@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+from src.helpers.batching import MicroBatcher
+
+
+def test_timed_out_item_is_withdrawn_from_its_batch():
+    release, flushed = threading.Event(), []
+
+    def flush(key, items):
+        release.wait(5)
+        flushed.extend(items)
+        return [True] * len(items)
+
+    batcher = MicroBatcher(flush=flush, max_size=1, max_wait=1, workers=1)
+    blocking = batcher.submit("key", "first")  # holds the only worker, the next batch waits in the pool
+
+    with pytest.raises(TimeoutError):
+        batcher.send("key", "second", timeout=0.1)
+
+    release.set()
+    assert blocking.result(timeout=5) is True
+    batcher.submit("key", "third").result(timeout=5)
+    assert flushed == ["first", "third"]
+
+
+def test_item_of_a_batch_being_sent_waits_for_its_result():
+    started = threading.Event()
+
+    def flush(key, items):
+        started.set()
+        threading.Event().wait(0.3)
+        return [True] * len(items)
+
+    batcher = MicroBatcher(flush=flush, max_size=1, max_wait=1, workers=1)
+
+    assert batcher.send("key", "item", timeout=0.1) is True
+    assert started.is_set()
@@ -0,0 +1,35 @@
+import pytest
+from src.helpers.circuit_breaker import OPEN
+from src.helpers.circuit_breaker import CircuitBreaker
+from src.helpers.circuit_breaker import CircuitOpenError
+from src.helpers.fan_out import GroupResult
+from twilio.base.exceptions import TwilioRestException
+
+
+def group(error):
+    result = GroupResult()
+    result.add("+12025550100")
+    result.add("+12025550101", error)
+    return result
+
+
+def test_group_with_retryable_recipient_errors_opens_the_breaker():
+    breaker = CircuitBreaker("twilio", window=4, min_calls=4, failure_rate=0.5)
+    unavailable = TwilioRestException(503, "https://api.twilio.com", "Service Unavailable")
+
+    for _ in range(4):
+        breaker.call(group, unavailable)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(group, None)
+
+
+def test_group_with_refused_recipients_keeps_the_breaker_closed():
+    breaker = CircuitBreaker("twilio", window=4, min_calls=4, failure_rate=0.5)
+    invalid_receptor = TwilioRestException(400, "https://api.twilio.com", "Invalid 'To' Phone Number")
+
+    for _ in range(4):
+        breaker.call(group, invalid_receptor)
+
+    assert breaker.state != OPEN
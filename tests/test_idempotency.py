@@ -0,0 +1,36 @@
+import pytest
+from src.core import settings
+from src.helpers.idempotency import IdempotencyCache
+
+
+@pytest.fixture
+def new_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_FILE", str(tmp_path / "sent.tsv"))
+    monkeypatch.delattr(IdempotencyCache, "instance", raising=False)
+
+    def new_cache():
+        # a new process of the supervisor, each one has its own cache of the shared file.
+        monkeypatch.delattr(IdempotencyCache, "instance", raising=False)
+        cache = IdempotencyCache()
+        with cache.claim("load"):
+            pass
+        return cache
+
+    yield new_cache
+    monkeypatch.delattr(IdempotencyCache, "instance", raising=False)
+
+
+def test_rewrite_keeps_the_messages_of_other_processes(new_cache):
+    first = new_cache()
+    first.remember("Send.single:id:1")
+    second = new_cache()
+    second.remember("Send.single:id:2")
+
+    with second._locked():
+        second._compact(0)
+    first.remember("Send.single:id:3")  # appended to the rewritten file, not to the one it replaced
+
+    restarted = new_cache()
+    for key in ("Send.single:id:1", "Send.single:id:2", "Send.single:id:3"):
+        with restarted.claim(key) as fresh:
+            assert not fresh
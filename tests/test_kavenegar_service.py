@@ -0,0 +1,32 @@
+from kavenegar import APIException
+from src.core import settings
+from src.core.rabbitmq.retry import RETRYABLE
+from src.core.rabbitmq.retry import classify
+from src.helpers.sms_proxy.services import KavenegarService
+
+
+class SendArray:
+    """`sms_sendarray` of a Kavenegar account refusing the chunks holding a `failing` receptor."""
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.chunks = []
+
+    def sms_sendarray(self, params):
+        self.chunks.append(params["receptor"])
+        if self.failing in params["receptor"]:
+            raise APIException("APIException[418] credit is not enough".encode("utf-8"))
+        return [{"status": 1} for _ in params["receptor"]]
+
+
+def test_failed_chunk_fails_its_recipients_only(monkeypatch):
+    monkeypatch.setattr(settings, "KAVEHNEGAR_SENDARRAY_LIMIT", 2)
+    service = KavenegarService("BENCHMARK")
+    service.kavenegar_api = SendArray(failing="09100000003")
+
+    result = service.send_group_message(["09100000001", "09100000002", "09100000003", "09100000004", "09100000005"], "salam")
+
+    assert service.kavenegar_api.chunks == [["09100000001", "09100000002"], ["09100000003", "09100000004"], ["09100000005"]]
+    assert result.succeeded == ["09100000001", "09100000002", "09100000005"]
+    assert result.unsent == ["09100000003", "09100000004"]
+    assert all(classify(error) == RETRYABLE for error in result.errors.values())
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from src.core import settings
+from src.helpers.circuit_breaker import CircuitOpenError
+from src.helpers.fan_out import GroupResult
+from src.helpers.json_parser import Jsonify
+from src.helpers.sms_proxy import SMSServiceProxy
+from src.helpers.sms_proxy.registry import ProviderRegistry
+from src.resources.sms import Send
+
+
+class UnavailableService:
+    """Provider whose circuit breaker is open."""
+
+    def send_single_message(self, recipient, message):
+        raise CircuitOpenError("kavenegar", 30)
+
+    def send_otp_message(self, recipient, otp_code):
+        raise CircuitOpenError("kavenegar", 30)
+
+    def send_group_message(self, recipients, message):
+        raise CircuitOpenError("kavenegar", 30)
+
+
+class RecordingService:
+    """Provider recording the recipients it was called with, `refused` recipients fail like a Twilio 400."""
+
+    def __init__(self, refused=()):
+        self.recipients = []
+        self.refused = set(refused)
+
+    def send_single_message(self, recipient, message):
+        self.recipients.append(recipient)
+        return True
+
+    def send_otp_message(self, recipient, otp_code):
+        self.recipients.append(recipient)
+        return True
+
+    def send_group_message(self, recipients, message):
+        self.recipients.extend(recipients)
+        result = GroupResult()
+        for recipient in recipients:
+            result.add(recipient, Exception(f"Twilio: Error sending group message to {recipient}") if recipient in self.refused else None)
+        return result
+
+
+def use(monkeypatch, kavenegar, twilio):
+    monkeypatch.setattr(ProviderRegistry, "kavenegar", lambda self, api_key: kavenegar)
+    monkeypatch.setattr(ProviderRegistry, "twilio", lambda self, account_sid, auth_token: twilio)
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    providers = {"kavenegar": RecordingService(), "twilio": RecordingService()}
+    use(monkeypatch, providers["kavenegar"], providers["twilio"])
+    return providers
+
+
+@pytest.fixture
+def failover(monkeypatch):
+    kavenegar, twilio = UnavailableService(), RecordingService(refused={"+989101111112"})
+    use(monkeypatch, kavenegar, twilio)
+    monkeypatch.setattr(settings, "SMS_FAILOVER", {"kavenegar": "twilio"})
+    monkeypatch.setattr(settings, "IDEMPOTENCY_ENABLED", False)
+    return kavenegar, twilio
+
+
+def message(receptor, text="salam"):
+    return json.dumps({"application": "MY-APP", "created_time": "2020-01-01 20:22:00", "data": {"receptor": receptor, "message": text}}).encode("utf-8")
+
+
+@pytest.mark.parametrize("recipient, provider", [("09101111111", "kavenegar"), ("+989101111111", "kavenegar"), ("+12025550123", "twilio")])
+def test_messages_are_routed_by_number_format(providers, recipient, provider):
+    SMSServiceProxy().send_single_message(recipient, "salam")
+    SMSServiceProxy().send_otp_message(recipient, "1234")
+
+    assert {name: len(service.recipients) for name, service in providers.items()} == {"kavenegar": 0, "twilio": 0, provider: 2}
+
+
+@pytest.mark.parametrize("recipients, provider", [(["09101111111", "+989101111112"], "kavenegar"), (["09101111111", "+12025550123"], "twilio")])
+def test_groups_go_to_kavenegar_only_if_every_number_is_iranian(providers, recipients, provider):
+    SMSServiceProxy().send_group_message(recipients, "salam")
+
+    assert {name: len(service.recipients) for name, service in providers.items()} == {"kavenegar": 0, "twilio": 0, provider: 2}
+
+
+def test_mixed_groups_send_national_numbers_to_twilio_in_e164(providers):
+    SMSServiceProxy().send_group_message(["09101111111", "+12025550123"], "salam")
+
+    assert providers["twilio"].recipients == ["+989101111111", "+12025550123"]
+
+
+def test_failover_sends_national_numbers_to_twilio_in_e164(failover):
+    _, twilio = failover
+    response = Jsonify.dict(message("09101111111"), Jsonify.SMSJType.SINGLE)
+
+    assert Send.single(response=response) is True
+    assert twilio.recipients == ["+989101111111"]
+
+
+def test_failover_reports_group_recipients_in_the_message_format(failover):
+    _, twilio = failover
+    response = Jsonify.dict(message(["09101111111", "09101111112"]), Jsonify.SMSJType.GROUP)
+
+    result = Send.group(response=response)
+
+    assert twilio.recipients == ["+989101111111", "+989101111112"]
+    assert result.succeeded == ["09101111111"]
+    assert result.unsent == ["09101111112"]